@@ -2,11 +2,17 @@
 from flask import Flask
 from .controllers.upload import upload_blueprint
 from app.integration import integration_blueprint
+from app.result_cache import cache, CACHE_CONFIG
+from app.metrics import metrics_blueprint
 
-def create_app():
+def create_app(cache_config=CACHE_CONFIG):
     app = Flask(__name__, template_folder='templates', static_folder='static')
+    # Cache des archives produites par /medor et /carlsberg (Redis ; CACHE_TYPE 'NullCache' pour le désactiver)
+    cache.init_app(app, config=cache_config)
     # Enregistrement de vos endpoints existants
     app.register_blueprint(upload_blueprint)
     # Enregistrement du blueprint d’intégration (nouvel endpoint /monoprix)
     app.register_blueprint(integration_blueprint)
+    # Métriques Prometheus des pipelines (/metrics)
+    app.register_blueprint(metrics_blueprint)
     return app
@@ -1,28 +1,61 @@
-from flask import Blueprint, render_template, request, send_file
+from flask import Blueprint, Response, render_template, request, send_file, jsonify, url_for
 from ..model.logic import (
     allowed_file,
-    rename_medor,
-    changer_errormessage,
-    count_errors_by_type_and_manufacturer,
-    nettoyer_ligne_colonne,
-    ajouter_data_quality_type,
-    add_columns_and_remove,
-    sort_missing_relationships,
-    keep_first_occurrence_for_missing_relationship,
-    modify_error_type,
-    save_dfs_to_excel,
-    modify_error_type_carl
+    format_error_counts,
 )
-import pandas as pd 
+from ..model.archive import (
+    zip_chunks,
+    file_entry,
+    text_entry,
+    report_entries,
+    check_output_formats,
+    DEFAULT_OUTPUT_FORMATS,
+)
+from ..model.pipeline import PipelineStats, run_medor_pipeline, run_carlsberg_pipeline
+from ..model.delta import run_medor_delta
+from ..model.streaming import process_medor_in_chunks
+from ..model.jobs import create_job_dir, JOB_UPLOAD_NAME
+from ..model.ingest import read_export, read_header, check_required_columns
+from ..model.batch import save_batch_inputs, run_medor_batch
+from ..model import polars_backend
+from ..result_cache import result_cache_key, get_cached_result, store_result_file, cache_stream
+from tasks import process_upload_task
 from io import BytesIO
-import zipfile
+import os
+import shutil
+import tempfile
+import uuid
+import unicodedata
 from datetime import datetime
-import dask.dataframe as dd
+from urllib.parse import quote
+
+# Mode de traitement Medor par défaut : 'memory' (fichier entier en mémoire), 'stream' (par blocs)
+# ou 'async' (tâche Celery en arrière-plan)
+MEDOR_DEFAULT_MODE = os.getenv('MEDOR_MODE', 'memory')
+# Mode de traitement Carlsberg par défaut : 'memory' ou 'async'
+CARLSBERG_DEFAULT_MODE = os.getenv('CARLSBERG_MODE', 'memory')
+
+# Mode delta Medor par défaut (champ 'delta') : seules les erreurs absentes du traitement
+# précédent du même export sont mises en forme, les erreurs disparues sont listées à part
+MEDOR_DEFAULT_DELTA = os.getenv('MEDOR_DELTA', '0') == '1'
+
+# Moteur de calcul par défaut : 'pandas' ou 'polars' (modifiable par requête avec le champ 'backend')
+DEFAULT_BACKEND = os.getenv('DATA_FILTER_BACKEND', 'pandas')
 
 
 
 upload_blueprint = Blueprint('upload', __name__)
 
+def requested_formats():
+    """
+    Formats de sortie demandés avec le champ 'format' (plusieurs valeurs, ou séparées par des virgules) :
+    csv, xlsx, parquet, arrow. Par défaut, les fichiers CSV et le rapport Excel.
+    """
+    formats = [value.strip().lower() for field in request.form.getlist('format') for value in field.split(',')]
+    formats = list(dict.fromkeys(value for value in formats if value)) or DEFAULT_OUTPUT_FORMATS
+    check_output_formats(formats)
+    return formats
+
 @upload_blueprint.route('/', methods=['GET'])
 def select_page():
     return render_template('select_page.html')
@@ -37,77 +70,245 @@ def upload_file_medor():
             return render_template('upload.html', error_message='Aucun fichier sélectionné.')
     
         if file and allowed_file(file.filename):
+            mode = request.form.get('mode') or MEDOR_DEFAULT_MODE
             try:
-                df = pd.read_csv(file, sep=";", low_memory=False)
-                # Renommer les colonnes selon marghertira
-                df = rename_medor(df)
-                # Modifier le champ _ErrorMessage en ErrorType
-                df = changer_errormessage(df)
-                # Cree le CSV de KPI
-                df_kpi=count_errors_by_type_and_manufacturer(df)
-                
-
-                # Supprimer les lignes vides et colonnes vides 
-                df = nettoyer_ligne_colonne(df)
-
-                # Ajouter la colonne DataQualityType
-                df = ajouter_data_quality_type(df)
-
-                # Ajouter la colonne ErrorStatus
-                df['ErrorStatus'] = 'on going'
+                formats = requested_formats()
+            except ValueError as e:
+                return render_template('upload.html', error_message=str(e))
+            if mode == 'async':
+                return start_upload_job(file, 'medor', formats)
+            backend = request.form.get('backend') or DEFAULT_BACKEND
+            delta = request.form.get('delta', '1' if MEDOR_DEFAULT_DELTA else '0') in ('1', 'on')
+            if delta:
+                # Le résultat dépend des traitements précédents : pas de cache des résultats
+                if mode != 'memory' or backend != 'pandas':
+                    return render_template('upload.html', error_message='Le mode delta ne fonctionne qu\'avec le traitement par défaut et le moteur pandas.')
+                return upload_file_medor_delta(file, formats)
 
-                # Filtrer les données pour chaque type d'erreur
-                df_logic_duplicate = df[df['ErrorType'].str.startswith('Logical Duplicate with')]
-                df_perfect_duplicate = df[df['ErrorType'].str.startswith('Perfect Duplicate with')]
-                df_missing_relationship = df[df['ErrorType'].str.startswith('Missing relationship')]
+            # Même fichier déjà traité aujourd'hui : l'archive en cache est renvoyée directement
+            today = datetime.today().strftime('%Y-%m-%d')
+            file_name = "_".join(file.filename.split("_")[:3])
+            cache_key = result_cache_key(file, 'medor', f'{file_name}_{today}:{",".join(formats)}', backend, mode, delta)
+            cached = get_cached_result(cache_key)
+            if cached is not None:
+                return cached_zip_response(cached, f'filtered_data_{file_name}.zip')
 
-                # Ajouter les colonnes et supprimer les colonnes inutiles
-                df_logic_duplicate = add_columns_and_remove(df_logic_duplicate)
-                df_perfect_duplicate = add_columns_and_remove(df_perfect_duplicate)
-                df_missing_relationship = add_columns_and_remove(df_missing_relationship)
+            if mode == 'stream':
+                if sorted(formats) != sorted(DEFAULT_OUTPUT_FORMATS):
+                    return render_template('upload.html', error_message='Le mode par blocs ne produit que les fichiers CSV et Excel.')
+                return upload_file_medor_stream(file, cache_key)
+            if backend == 'polars':
+                return upload_file_polars(file, 'medor', cache_key, formats)
+            try:
+                # Durée et lignes de chaque étape publiées sur /metrics
+                stats = PipelineStats(pipeline='medor')
+                df = stats.run('read_export', read_export, file, 'medor')
                 print(f"Colonnes après le chargement du fichier: {df.columns.tolist()}")
                 print(f"Taille du DataFrame après le chargement: {df.shape}") 
-                # Classifier les types d'erreur dans une colonne spécifiée 
-                df_missing_relationship = sort_missing_relationships(df_missing_relationship.copy())  
-                
-                # Garder la première occurrence pour les Missing relationship
-                df_missing_relationship = keep_first_occurrence_for_missing_relationship(df_missing_relationship,"ParentId")
-                # Traduction du message de log par quelque chose de plus intelligible par le client 
-                df_missing_relationship=modify_error_type(df_missing_relationship)
-
-                
-                # Ajout de la date d'aujourd'hui
-                today = datetime.today().strftime('%Y-%m-%d')
-
-                file.filename="_".join(file.filename.split("_")[:3])
-            
-                excel_buffer= BytesIO()
-                save_dfs_to_excel(df_logic_duplicate,df_perfect_duplicate,df_missing_relationship,excel_buffer)
 
+                # Pipeline Medor : renommage, ErrorType, KPI, nettoyage, filtres et traduction des messages
+                df_logic_duplicate, df_perfect_duplicate, df_missing_relationship, counts = run_medor_pipeline(df, stats)
+                del df
+                # Cree le CSV de KPI
+                df_kpi = stats.run('format_error_counts', format_error_counts, counts)
+                if stats.enabled:
+                    stats.report()
 
-                zip_buffer=BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, False) as zip_file:
-                    # Ajouter les fichiers CSV et excel dans le fichier ZIP en utilisant les noms de fichiers construits
-                    zip_file.writestr(f"Logic_duplicate_{file.filename}_{today}.csv", df_logic_duplicate.to_csv(index=False, encoding="utf-8", sep=";"))
-                    zip_file.writestr(f"Perfect_duplicate_{file.filename}_{today}.csv", df_perfect_duplicate.to_csv(index=False, encoding="utf-8", sep=";"))
-                    zip_file.writestr(f"Missing_relationship_{file.filename}_{today}.csv", df_missing_relationship.to_csv(index=False, encoding="utf-8", sep=";"))
-                    zip_file.writestr(f'ALL_Errors_report_{file.filename}_{today}.xlsx', excel_buffer.getvalue())
-                    zip_file.writestr(f"KPI_{file.filename}_{today}.csv", df_kpi.to_csv(index=False, encoding="utf-8", sep=";"))
+                file.filename = file_name
+            
+                # Fichiers de l'archive ZIP dans les formats demandés, écrits au fil de l'envoi
+                # (le rapport Excel passe par un fichier temporaire, en mode 'constant_memory')
+                entries = report_entries(f'{file.filename}_{today}',
+                                         [df_logic_duplicate, df_perfect_duplicate, df_missing_relationship],
+                                         df_kpi, formats)
 
-                zip_buffer.seek(0)
                 # Retourner le fichier ZIP en tant que réponse à la requête POST
-                return send_file(
-                    zip_buffer,
-                    as_attachment=True,
-                    mimetype='application/zip',
-                    download_name=f'filtered_data_{file.filename}.zip'
-                    )
+                return zip_response(entries, f'filtered_data_{file.filename}.zip', cache_key)
             except Exception as e:
               return render_template('upload.html', error_message=f'Erreur lors du traitement du fichier : {str(e)}')
         else:
             return render_template('upload.html', error_message='Extension de fichier non autorisée.')
     return render_template('upload.html')
 
+@upload_blueprint.route('/medor/batch', methods=['GET','POST'])
+def upload_files_medor_batch():
+    """
+    Traite plusieurs exports Medor (plusieurs CSV ou une archive ZIP de CSV) en parallèle et
+    renvoie une seule archive : les rapports de chaque fichier et un KPI combiné.
+    """
+    if request.method == 'POST':
+        files = [file for file in request.files.getlist('files') + request.files.getlist('file') if file.filename]
+        if not files:
+            return render_template('batch_upload.html', error_message='Aucun fichier sélectionné.')
+
+        work_dir = tempfile.mkdtemp(prefix='medor_batch_')
+        try:
+            formats = requested_formats()
+            today = datetime.today().strftime('%Y-%m-%d')
+            paths = save_batch_inputs(files, os.path.join(work_dir, 'inputs'))
+            entries = run_medor_batch(paths, work_dir, today, formats)
+            response = zip_response([(name, file_entry(path)) for name, path in entries],
+                                    f'filtered_data_batch_{today}.zip')
+            # Supprimer les fichiers du lot une fois la réponse envoyée
+            response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+            return response
+        except Exception as e:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return render_template('batch_upload.html', error_message=f'Erreur lors du traitement du lot : {str(e)}')
+    return render_template('batch_upload.html')
+
+def after_stream(chunks, callback):
+    """
+    Transmet les morceaux d'une archive puis appelle `callback` une fois l'archive entièrement
+    produite (pas d'appel si l'envoi est interrompu ou échoue)
+    """
+    yield from chunks
+    callback()
+
+def zip_response(entries, download_name, cache_key=None, on_complete=None):
+    """
+    Envoie l'archive ZIP par morceaux pendant qu'elle est construite (voir zip_chunks) :
+    le client reçoit les premières entrées pendant l'écriture des suivantes.
+    Avec `cache_key`, l'archive complète est mise en cache pour les uploads identiques.
+    `on_complete` est appelé une fois le dernier morceau produit.
+    """
+    chunks = zip_chunks(entries)
+    if cache_key is not None:
+        chunks = cache_stream(cache_key, chunks)
+    if on_complete is not None:
+        chunks = after_stream(chunks, on_complete)
+    response = Response(chunks, mimetype='application/zip')
+    # Même en-tête Content-Disposition que send_file (nom non ASCII encodé selon la RFC 5987)
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+    return response
+
+def cached_zip_response(data, download_name):
+    """
+    Renvoie une archive ZIP trouvée dans le cache des résultats
+    """
+    return send_file(
+        BytesIO(data),
+        as_attachment=True,
+        mimetype='application/zip',
+        download_name=download_name
+        )
+
+def start_upload_job(file, pipeline, formats=DEFAULT_OUTPUT_FORMATS):
+    """
+    Enregistre l'upload dans le répertoire partagé et lance le pipeline sur le worker Celery.
+    La requête retourne immédiatement l'identifiant de la tâche (suivi via /task_status, ZIP via /download).
+    """
+    task_id = str(uuid.uuid4())
+    job_dir = create_job_dir(task_id)
+    try:
+        file.save(os.path.join(job_dir, JOB_UPLOAD_NAME))
+        file_name = "_".join(file.filename.split("_")[:3])
+        today = datetime.today().strftime('%Y-%m-%d')
+        process_upload_task.apply_async(args=[pipeline, job_dir, file_name, today, formats], task_id=task_id)
+    except Exception as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return render_template('upload.html', error_message=f'Erreur lors du lancement du traitement : {str(e)}')
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'task_id': task_id,
+            'status_url': url_for('integration.task_status', task_id=task_id),
+            'download_url': url_for('integration.download_file', task_id=task_id),
+        }), 202
+    return render_template('upload.html', task_id=task_id), 202
+
+def upload_file_medor_delta(file, formats=DEFAULT_OUTPUT_FORMATS):
+    """
+    Traite un export Medor en mode delta (voir run_medor_delta) : les rapports ne contiennent que
+    les nouvelles erreurs et l'archive ajoute la liste des erreurs résolues depuis le traitement précédent.
+    """
+    try:
+        today = datetime.today().strftime('%Y-%m-%d')
+        file_name = "_".join(file.filename.split("_")[:3])
+        stats = PipelineStats(pipeline='medor_delta')
+        df = stats.run('read_export', read_export, file, 'medor')
+        df_logic_duplicate, df_perfect_duplicate, df_missing_relationship, df_resolved, counts, save = \
+            run_medor_delta(df, file_name, today, stats=stats)
+        del df
+        df_kpi = stats.run('format_error_counts', format_error_counts, counts)
+        if stats.enabled:
+            stats.report()
+
+        entries = report_entries(f'{file_name}_{today}',
+                                 [df_logic_duplicate, df_perfect_duplicate, df_missing_relationship],
+                                 df_kpi, formats, extra_reports=[('Resolved_errors', df_resolved)])
+        # Les empreintes ne sont enregistrées qu'une fois l'archive entièrement produite
+        return zip_response(entries, f'filtered_data_{file_name}.zip', on_complete=save)
+    except Exception as e:
+        return render_template('upload.html', error_message=f'Erreur lors du traitement du fichier : {str(e)}')
+
+def upload_file_medor_stream(file, cache_key=None):
+    """
+    Traite un export Medor par blocs : les rapports sont écrits sur disque au fil de l'eau
+    et l'archive ZIP est envoyée depuis un fichier temporaire (et mise en cache avec `cache_key`).
+    """
+    work_dir = tempfile.mkdtemp(prefix='medor_')
+    try:
+        today = datetime.today().strftime('%Y-%m-%d')
+        file_name = "_".join(file.filename.split("_")[:3])
+        zip_path = process_medor_in_chunks(file, work_dir, file_name, today)
+        if cache_key is not None:
+            store_result_file(cache_key, zip_path)
+        response = send_file(
+            zip_path,
+            as_attachment=True,
+            mimetype='application/zip',
+            download_name=f'filtered_data_{file_name}.zip'
+            )
+        # Supprimer les fichiers temporaires une fois la réponse envoyée
+        response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+        return response
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return render_template('upload.html', error_message=f'Erreur lors du traitement du fichier : {str(e)}')
+
+def upload_file_polars(file, pipeline, cache_key=None, formats=DEFAULT_OUTPUT_FORMATS):
+    """
+    Exécute le pipeline Medor ou Carlsberg avec le moteur Polars (lecture paresseuse,
+    exécution multi-thread) et renvoie la même archive ZIP que le moteur pandas.
+    """
+    work_dir = tempfile.mkdtemp(prefix=f'{pipeline}_')
+    try:
+        # scan_csv lit depuis un chemin : l'upload est d'abord enregistré sur disque
+        csv_path = os.path.join(work_dir, 'upload.csv')
+        file.save(csv_path)
+        check_required_columns(read_header(csv_path), pipeline)
+        file_name = "_".join(file.filename.split("_")[:3])
+
+        # Le plan Polars est exécuté d'un bloc : une seule étape mesurée
+        stats = PipelineStats(enabled=False, pipeline=f'{pipeline}_polars')
+        if pipeline == 'medor':
+            today = datetime.today().strftime('%Y-%m-%d')
+            suffix = f'{file_name}_{today}'
+            df_logic_duplicate, df_perfect_duplicate, df_missing_relationship, df_kpi = \
+                stats.run('run_medor_pipeline_pl', polars_backend.run_medor_pipeline_pl, csv_path)
+        else:
+            suffix = file_name
+            df_logic_duplicate, df_perfect_duplicate, df_missing_relationship = \
+                stats.run('run_carlsberg_pipeline_pl', polars_backend.run_carlsberg_pipeline_pl, csv_path)
+            df_kpi = None
+
+        entries = report_entries(suffix, [df_logic_duplicate, df_perfect_duplicate, df_missing_relationship],
+                                 df_kpi, formats,
+                                 csv_writer=lambda df: text_entry(polars_backend.to_csv_text(df)),
+                                 to_pandas=polars_backend.to_pandas)
+        return zip_response(entries, f'filtered_data_{file_name}.zip', cache_key)
+    except Exception as e:
+        return render_template('upload.html', error_message=f'Erreur lors du traitement du fichier : {str(e)}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 @upload_blueprint.route('/carlsberg', methods=['GET','POST'])
 def upload_file_carl():
     if request.method == 'POST':
@@ -119,57 +320,43 @@ def upload_file_carl():
             return render_template('upload.html', error_message='Aucun fichier sélectionné.')
     
         if file and allowed_file(file.filename):
-            try:   
-                df = pd.read_csv(file, sep=";", low_memory=False)
-                
-                # Modifier le champ _ErrorMessage en ErrorType
-                df = changer_errormessage(df)
-                # Supprimer les lignes vides et colonnes vides 
-                df = nettoyer_ligne_colonne(df)
-
-                # Filtrer les données pour chaque type d'erreur
-                df_logic_duplicate = df[df['ErrorType'].str.startswith('Logical Duplicate with')]
-                df_perfect_duplicate = df[df['ErrorType'].str.startswith('Perfect Duplicate with')]
-                df_missing_relationship = df[df['ErrorType'].str.startswith('Missing relationship')]
-
-                # Classifier les types d'erreur dans une colonne spécifiée 
-                df_missing_relationship = sort_missing_relationships(df_missing_relationship)
-
-                # Garder la première occurrence pour les Missing relationship
-                df_missing_relationship = keep_first_occurrence_for_missing_relationship(df_missing_relationship, "traceId")
-
-                # Convertir en Dask DataFrame pour utiliser modify_error_type_carl
-                ddf_missing_relationship = dd.from_pandas(df_missing_relationship, npartitions=15)
-
-                # Appliquer la fonction modifiée pour Dask
-                ddf_missing_relationship = ddf_missing_relationship.map_partitions(modify_error_type_carl, meta=df_missing_relationship.head(0))
+            try:
+                formats = requested_formats()
+            except ValueError as e:
+                return render_template('upload.html', error_message=str(e))
+            mode = request.form.get('mode') or CARLSBERG_DEFAULT_MODE
+            if mode == 'async':
+                return start_upload_job(file, 'carlsberg', formats)
+            backend = request.form.get('backend') or DEFAULT_BACKEND
 
-                # Calculer le résultat final
-                df_missing_relationship = ddf_missing_relationship.compute()
+            # Même fichier déjà traité : l'archive en cache est renvoyée directement
+            file_name = "_".join(file.filename.split("_")[:3])
+            cache_key = result_cache_key(file, 'carlsberg', f'{file_name}:{",".join(formats)}', backend, mode)
+            cached = get_cached_result(cache_key)
+            if cached is not None:
+                return cached_zip_response(cached, f'filtered_data_{file_name}.zip')
 
-                df_missing_relationship.drop(columns=['ErrorType'], inplace=True)
+            if backend == 'polars':
+                return upload_file_polars(file, 'carlsberg', cache_key, formats)
+            try:   
+                # Durée et lignes de chaque étape publiées sur /metrics
+                stats = PipelineStats(pipeline='carlsberg')
+                df = stats.run('read_export', read_export, file, 'carlsberg')
 
-                file.filename = "_".join(file.filename.split("_")[:3])
+                # Pipeline Carlsberg : ErrorType, nettoyage, filtres et traduction des messages
+                df_logic_duplicate, df_perfect_duplicate, df_missing_relationship = run_carlsberg_pipeline(df, stats)
+                del df
+                if stats.enabled:
+                    stats.report()
 
-                excel_buffer = BytesIO()
-                save_dfs_to_excel(df_logic_duplicate, df_perfect_duplicate, df_missing_relationship, excel_buffer)
+                file.filename = file_name
 
-                zip_buffer = BytesIO()
-                
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, False) as zip_file:
-                    # Ajouter les fichiers CSV dans le fichier ZIP en utilisant les noms de fichiers construits
-                    zip_file.writestr(f"Logic_duplicate_{file.filename}.csv", df_logic_duplicate.to_csv(index=False, encoding="utf-8", sep=";"))
-                    zip_file.writestr(f"Perfect_duplicate_{file.filename}.csv", df_perfect_duplicate.to_csv(index=False, encoding="utf-8", sep=";"))
-                    zip_file.writestr(f"Missing_relationship_{file.filename}.csv", df_missing_relationship.to_csv(index=False, encoding="utf-8", sep=";"))
-                    zip_file.writestr(f'ALL_Errors_report_{file.filename}.xlsx', excel_buffer.getvalue())
-                zip_buffer.seek(0)
+                # Fichiers de l'archive ZIP dans les formats demandés, écrits au fil de l'envoi
+                entries = report_entries(file.filename,
+                                         [df_logic_duplicate, df_perfect_duplicate, df_missing_relationship],
+                                         formats=formats)
                 # Retourner le fichier ZIP en tant que réponse à la requête POST
-                return send_file(
-                    zip_buffer,
-                    as_attachment=True,
-                    mimetype='application/zip',
-                    download_name=f'filtered_data_{file.filename}.zip'
-                )
+                return zip_response(entries, f'filtered_data_{file.filename}.zip', cache_key)
 
             except Exception as e:
                 return render_template('upload.html', error_message=f'Erreur lors du traitement du fichier : {str(e)}')
@@ -49,6 +49,7 @@ def download_file(task_id):
         print("DEBUG: zip_file_path =", zip_file_path, type(zip_file_path))
         if not os.path.exists(zip_file_path):
             return jsonify({"error": "File not found", "path": zip_file_path}), 404
-        return send_file(zip_file_path, as_attachment=True, download_name="generated_templates.zip")
+        # Nom du ZIP produit par la tâche (generated_templates.zip, filtered_data_<fichier>.zip)
+        return send_file(zip_file_path, as_attachment=True, download_name=os.path.basename(zip_file_path))
     else:
         return jsonify({"error": "File not ready", "state": task_result.state}), 404
@@ -0,0 +1,87 @@
+# app/metrics.py
+import glob
+import os
+
+from flask import Blueprint, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+
+# Répertoire des métriques partagées entre processus (workers Celery en prefork) : si la variable
+# est définie, chaque processus y écrit ses mesures et l'exposition les additionne
+METRICS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+# Port de l'exporteur local du worker Celery (0 : pas d'exporteur)
+CELERY_METRICS_PORT = int(os.getenv('CELERY_METRICS_PORT', 9808))
+
+if METRICS_MULTIPROC_DIR:
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+ROWS_BUCKETS = (0, 100, 1000, 10000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000)
+
+# Étapes des pipelines (medor, carlsberg) et des tâches (generate_templates...)
+STAGE_SECONDS = Histogram('data_filter_stage_duration_seconds', "Durée d'une étape",
+                          ['pipeline', 'stage'], buckets=SECONDS_BUCKETS)
+STAGE_INPUT_ROWS = Histogram('data_filter_stage_input_rows', "Lignes reçues par une étape",
+                             ['pipeline', 'stage'], buckets=ROWS_BUCKETS)
+STAGE_OUTPUT_ROWS = Histogram('data_filter_stage_output_rows', "Lignes produites par une étape",
+                              ['pipeline', 'stage'], buckets=ROWS_BUCKETS)
+# Tâches Celery complètes, par nom de tâche et état final
+TASK_SECONDS = Histogram('data_filter_task_duration_seconds', "Durée d'une tâche Celery",
+                         ['task', 'state'], buckets=SECONDS_BUCKETS)
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+def observe_stage(pipeline, record):
+    """
+    Enregistre une étape mesurée par PipelineStats (durée et, si connues, lignes en entrée et en sortie)
+    """
+    STAGE_SECONDS.labels(pipeline, record['stage']).observe(record['seconds'])
+    if record.get('input_rows') is not None:
+        STAGE_INPUT_ROWS.labels(pipeline, record['stage']).observe(record['input_rows'])
+    if record.get('output_rows') is not None:
+        STAGE_OUTPUT_ROWS.labels(pipeline, record['stage']).observe(record['output_rows'])
+
+
+def observe_task(task, state, seconds):
+    TASK_SECONDS.labels(task, state).observe(seconds)
+
+
+def metrics_registry():
+    """
+    Registre exposé : celui du processus, ou l'agrégat des processus en mode multiprocess
+    """
+    if not METRICS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Métriques au format texte Prometheus
+    """
+    return Response(generate_latest(metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def start_worker_exporter():
+    """
+    Démarre l'exporteur HTTP du worker Celery (processus principal, avant la création des
+    processus fils). Les mesures d'un démarrage précédent sont supprimées.
+    """
+    if METRICS_MULTIPROC_DIR:
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, '*.db')):
+            os.remove(path)
+    if CELERY_METRICS_PORT:
+        start_http_server(CELERY_METRICS_PORT, registry=metrics_registry())
+        print(f"[metrics] exporteur du worker sur le port {CELERY_METRICS_PORT}")
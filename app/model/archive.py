@@ -0,0 +1,434 @@
+import io
+import os
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .excel_writer import write_excel_report
+from .logic import iter_csv_chunks, WRITE_CHUNK_ROWS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow absent : sorties Parquet et Arrow indisponibles
+    pa = None
+
+
+# Taille des blocs copiés depuis un fichier vers l'archive
+COPY_CHUNK_BYTES = 1024 * 1024
+# Niveau de compression zlib des entrées (0 à 9)
+ZIP_COMPRESSION_LEVEL = int(os.getenv('ZIP_COMPRESSION_LEVEL', 6))
+# Nombre d'entrées produites et compressées en parallèle (1 : écriture séquentielle en streaming).
+# En parallèle, les premiers octets ne sont envoyés qu'une fois la première entrée compressée.
+ZIP_WORKERS = max(1, int(os.getenv('ZIP_WORKERS', 1)))
+# Taille au-delà de laquelle une entrée compressée en parallèle est mise en attente sur disque
+ZIP_SPOOL_BYTES = int(os.getenv('ZIP_SPOOL_BYTES', 16 * 1024 * 1024))
+
+# Formats de sortie des rapports : 'csv' et 'xlsx' (fichiers historiques), 'parquet' et 'arrow'
+# (Arrow IPC) qui conservent les types des colonnes
+OUTPUT_FORMATS = ['csv', 'xlsx', 'parquet', 'arrow']
+DEFAULT_OUTPUT_FORMATS = [value for value in os.getenv('OUTPUT_FORMATS', 'csv,xlsx').split(',') if value]
+
+# Valeur des champs de taille et de position reportés dans les extensions ZIP64
+ZIP64_MARKER = 0xFFFFFFFF
+# Version minimale d'extraction des entrées ZIP64
+ZIP64_VERSION = 45
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Sortie non repositionnable de ZipFile : les octets écrits sont mis de côté jusqu'au
+    prochain drain(). ZipFile écrit alors des descripteurs de données après chaque entrée.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _zip_info(name, date_time, level):
+    """
+    Métadonnées d'une entrée, identiques à celles de ZipFile.writestr
+    """
+    zinfo = zipfile.ZipInfo(name, date_time)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo._compresslevel = level
+    zinfo.external_attr = 0o600 << 16
+    return zinfo
+
+
+def stream_zip(entries, level=ZIP_COMPRESSION_LEVEL):
+    """
+    Produit une archive ZIP bloc par bloc, pendant l'écriture des entrées.
+    `entries` est une liste de (nom, writer) où writer(flux) est un générateur qui écrit le
+    contenu de l'entrée dans le flux et rend la main après chaque bloc écrit.
+    La taille des entrées n'est connue qu'à la fin : elles sont écrites en ZIP64 (sans limite
+    de 2 Go par entrée ni de 4 Go pour l'archive).
+    """
+    date_time = time.localtime(time.time())[:6]
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, True, compresslevel=level) as zip_file:
+        for name, writer in entries:
+            with zip_file.open(_zip_info(name, date_time, level), 'w', force_zip64=True) as entry:
+                for _ in writer(entry):
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            # Fin des données compressées et descripteur de données de l'entrée
+            data = buffer.drain()
+            if data:
+                yield data
+    # Répertoire central écrit à la fermeture de l'archive
+    yield buffer.drain()
+
+
+class _CompressedEntry(io.RawIOBase):
+    """
+    Flux d'écriture d'une entrée qui calcule le CRC et compresse (deflate brut) dans un fichier
+    temporaire, gardé en mémoire jusqu'à ZIP_SPOOL_BYTES
+    """
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self.spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_BYTES)
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+        self._add(self.compressor.compress(data))
+        return len(data)
+
+    def _add(self, compressed):
+        if compressed:
+            self.spool.write(compressed)
+            self.compress_size += len(compressed)
+
+    def finish(self):
+        self._add(self.compressor.flush())
+        self.spool.seek(0)
+        return self
+
+    def chunks(self):
+        """
+        Données compressées, par blocs de COPY_CHUNK_BYTES
+        """
+        while True:
+            data = self.spool.read(COPY_CHUNK_BYTES)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self.spool.close()
+        super().close()
+
+
+def _compress_entry(writer, level):
+    """
+    Produit et compresse une entrée complète (exécuté dans un thread du pool)
+    """
+    entry = _CompressedEntry(level)
+    try:
+        for _ in writer(entry):
+            pass
+        return entry.finish()
+    except BaseException:
+        entry.close()
+        raise
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def _zip64_extra(values):
+    """
+    Champ extra ZIP64 (identifiant 1) : valeurs 64 bits des champs remplacés par ZIP64_MARKER
+    """
+    return struct.pack('<HH' + 'Q' * len(values), 1, 8 * len(values), *values)
+
+
+def _end_of_central_directory(count, size, offset):
+    """
+    Fin du répertoire central, précédée des enregistrements ZIP64 si le nombre d'entrées,
+    la taille ou la position du répertoire dépassent les champs classiques (comme ZipFile)
+    """
+    records = b''
+    if count > zipfile.ZIP_FILECOUNT_LIMIT or size > zipfile.ZIP64_LIMIT or offset > zipfile.ZIP64_LIMIT:
+        records = (struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, ZIP64_VERSION, ZIP64_VERSION,
+                               0, 0, count, count, size, offset)
+                   + struct.pack('<4sLQL', b'PK\x06\x07', 0, offset + size, 1))
+        count = min(count, 0xFFFF)
+        size = min(size, ZIP64_MARKER)
+        offset = min(offset, ZIP64_MARKER)
+    return records + struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, count, count, size, offset, 0)
+
+
+def stream_zip_parallel(entries, workers=ZIP_WORKERS, level=ZIP_COMPRESSION_LEVEL):
+    """
+    Produit une archive ZIP dont les entrées sont écrites et compressées en parallèle dans un
+    pool de threads (zlib et l'écriture des CSV libèrent le GIL). Au plus `workers` entrées sont
+    produites en avance de celle en cours d'envoi ; elles sont émises dans l'ordre de `entries`,
+    avec la même date : le contenu de l'archive ne dépend pas de l'ordre de fin des threads.
+    """
+    dos_date, dos_time = _dos_date_time(time.localtime(time.time())[:6])
+    pool = ThreadPoolExecutor(max_workers=workers)
+    remaining = iter(entries)
+    pending = deque()
+
+    def submit_next():
+        for name, writer in remaining:
+            pending.append((name, pool.submit(_compress_entry, writer, level)))
+            return
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        offset = 0
+        central_directory = []
+        while pending:
+            name, future = pending.popleft()
+            with future.result() as entry:
+                submit_next()
+                try:
+                    encoded_name = name.encode('ascii')
+                    flag_bits = 0
+                except UnicodeEncodeError:
+                    encoded_name = name.encode('utf-8')
+                    flag_bits = 0x800
+
+                # Tailles et position au-delà de ZIP64_LIMIT : extensions ZIP64, comme ZipFile
+                zip64 = entry.file_size > zipfile.ZIP64_LIMIT or entry.compress_size > zipfile.ZIP64_LIMIT
+                sizes = (ZIP64_MARKER, ZIP64_MARKER) if zip64 else (entry.compress_size, entry.file_size)
+                local_extra = _zip64_extra([entry.file_size, entry.compress_size]) if zip64 else b''
+                central_values = [value for value in (entry.file_size, entry.compress_size, offset)
+                                  if value > zipfile.ZIP64_LIMIT]
+                central_extra = _zip64_extra(central_values) if central_values else b''
+                version = ZIP64_VERSION if zip64 else 20
+
+                yield struct.pack('<4s5H3L2H', b'PK\x03\x04', version, flag_bits, zipfile.ZIP_DEFLATED,
+                                  dos_time, dos_date, entry.crc, *sizes, len(encoded_name),
+                                  len(local_extra)) + encoded_name + local_extra
+                yield from entry.chunks()
+
+                version = ZIP64_VERSION if central_extra else 20
+                central_sizes = [ZIP64_MARKER if value > zipfile.ZIP64_LIMIT else value
+                                 for value in (entry.compress_size, entry.file_size, offset)]
+                central_directory.append(
+                    struct.pack('<4s2B5H3L5H2L', b'PK\x01\x02', version, 3, version, flag_bits,
+                                zipfile.ZIP_DEFLATED, dos_time, dos_date, entry.crc, *central_sizes[:2],
+                                len(encoded_name), len(central_extra), 0, 0, 0, 0o600 << 16,
+                                central_sizes[2]) + encoded_name + central_extra)
+                offset += 30 + len(encoded_name) + len(local_extra) + entry.compress_size
+
+        directory = b''.join(central_directory)
+        yield directory + _end_of_central_directory(len(central_directory), len(directory), offset)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Entrées déjà compressées mais non émises (archive interrompue)
+        for _, future in pending:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+
+def zip_chunks(entries, workers=ZIP_WORKERS, level=ZIP_COMPRESSION_LEVEL):
+    """
+    Morceaux d'une archive ZIP : en parallèle si plusieurs workers, sinon en streaming séquentiel
+    """
+    if workers > 1 and len(entries) > 1:
+        return stream_zip_parallel(entries, workers, level)
+    return stream_zip(entries, level)
+
+
+def write_zip_file(path, entries, workers=ZIP_WORKERS, level=ZIP_COMPRESSION_LEVEL):
+    """
+    Écrit une archive ZIP sur disque
+    """
+    with open(path, 'wb') as zip_file:
+        for chunk in zip_chunks(entries, workers, level):
+            zip_file.write(chunk)
+    return path
+
+
+def write_entry(path, writer):
+    """
+    Écrit le contenu d'une entrée dans un fichier (sans archive) et retourne son chemin
+    """
+    with open(path, 'wb') as output:
+        for _ in writer(output):
+            pass
+    return path
+
+
+def csv_entry(df):
+    """
+    Entrée CSV écrite bloc de lignes par bloc de lignes (dataframe_to_csv)
+    """
+    def writer(entry):
+        text = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+        for _ in iter_csv_chunks(df, text):
+            text.flush()
+            yield
+        text.detach()
+    return writer
+
+
+def text_entry(text):
+    """
+    Entrée dont le contenu est déjà une chaîne (petits fichiers comme le KPI)
+    """
+    def writer(entry):
+        entry.write(text.encode('utf-8'))
+        yield
+    return writer
+
+
+def file_entry(path, remove=False):
+    """
+    Entrée copiée depuis un fichier sur disque, supprimé ensuite si remove=True
+    """
+    def writer(entry):
+        try:
+            with open(path, 'rb') as source:
+                for block in iter(lambda: source.read(COPY_CHUNK_BYTES), b''):
+                    entry.write(block)
+                    yield
+        finally:
+            if remove:
+                os.remove(path)
+    return writer
+
+
+def excel_entry(df1, df2, df3):
+    """
+    Entrée ALL_Errors_report : le classeur est écrit dans un fichier temporaire au moment où
+    l'entrée est produite, copié dans l'archive puis supprimé
+    """
+    def writer(entry):
+        yield from file_entry(write_excel_report(df1, df2, df3), remove=True)(entry)
+    return writer
+
+
+def _arrow_table(df):
+    """
+    Table Arrow d'un rapport, types conservés. Le masque des cellules répétées (REPEAT_MASK_COLUMN)
+    est gardé comme colonne booléenne au lieu de vider les cellules ; les colonnes de types mélangés
+    sont converties en texte.
+    """
+    arrays = []
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.SparseDtype):
+            values = values.sparse.to_dense()
+        try:
+            arrays.append(pa.array(values, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array(values.where(values.isna(), values.astype(str)), from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+
+def parquet_entry(df):
+    """
+    Entrée Parquet écrite par groupes de WRITE_CHUNK_ROWS lignes
+    """
+    def writer(entry):
+        table = _arrow_table(df)
+        with pq.ParquetWriter(entry, table.schema) as parquet_writer:
+            for batch in table.to_batches(WRITE_CHUNK_ROWS):
+                parquet_writer.write_batch(batch)
+                yield
+    return writer
+
+
+def arrow_entry(df):
+    """
+    Entrée Arrow IPC (format fichier) écrite par lots de WRITE_CHUNK_ROWS lignes
+    """
+    def writer(entry):
+        table = _arrow_table(df)
+        with pa.ipc.new_file(entry, table.schema) as ipc_writer:
+            for batch in table.to_batches(WRITE_CHUNK_ROWS):
+                ipc_writer.write_batch(batch)
+                yield
+    return writer
+
+
+def check_output_formats(formats):
+    """
+    Vérifie les formats demandés : au moins un format connu, pyarrow installé pour Parquet et Arrow
+    """
+    unknown = [value for value in formats if value not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"Format de sortie inconnu : {', '.join(unknown) or 'aucun'} "
+                         f"(formats possibles : {', '.join(OUTPUT_FORMATS)}).")
+    if pa is None and {'parquet', 'arrow'} & set(formats):
+        raise ValueError("Les sorties Parquet et Arrow nécessitent pyarrow.")
+
+
+def report_entries(suffix, reports, df_kpi=None, formats=DEFAULT_OUTPUT_FORMATS, csv_writer=csv_entry,
+                   to_pandas=None, extra_reports=()):
+    """
+    Entrées de l'archive d'un pipeline dans les formats demandés : les trois rapports (doublons
+    logiques, doublons parfaits, missing relationship) en CSV, le classeur Excel, les rapports en
+    Parquet puis en Arrow, et enfin le KPI (Medor) dans chaque format tabulaire. Avec les formats
+    par défaut, les fichiers sont ceux des routes historiques, dans le même ordre.
+    `extra_reports` ajoute des rapports (préfixe, DataFrame pandas) aux formats tabulaires, hors
+    classeur Excel (ex. les erreurs résolues du mode delta).
+    Le moteur Polars fournit son propre `csv_writer` et la conversion `to_pandas` de ses résultats.
+    """
+    frames = reports
+    kpi_frame = df_kpi
+    if to_pandas is not None and set(formats) - {'csv'}:
+        frames = [to_pandas(report) for report in reports]
+        kpi_frame = None if df_kpi is None else to_pandas(df_kpi)
+
+    prefixes = ['Logic_duplicate', 'Perfect_duplicate', 'Missing_relationship']
+    extra_prefixes = [prefix for prefix, _ in extra_reports]
+    extra_frames = [frame for _, frame in extra_reports]
+    entries = []
+    if 'csv' in formats:
+        entries.extend((f'{prefix}_{suffix}.csv', csv_writer(report)) for prefix, report in zip(prefixes, reports))
+        entries.extend((f'{prefix}_{suffix}.csv', csv_entry(frame)) for prefix, frame in extra_reports)
+    if 'xlsx' in formats:
+        entries.append((f'ALL_Errors_report_{suffix}.xlsx', excel_entry(*frames)))
+    for value, writer in [('parquet', parquet_entry), ('arrow', arrow_entry)]:
+        if value in formats:
+            entries.extend((f'{prefix}_{suffix}.{value}', writer(frame))
+                           for prefix, frame in zip(prefixes + extra_prefixes, list(frames) + extra_frames))
+
+    if df_kpi is not None:
+        if 'csv' in formats:
+            entries.append((f'KPI_{suffix}.csv', csv_writer(df_kpi)))
+        for value, writer in [('parquet', parquet_entry), ('arrow', arrow_entry)]:
+            if value in formats:
+                entries.append((f'KPI_{suffix}.{value}', writer(kpi_frame)))
+    return entries
@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import zipfile
+
+from ..metrics import observe_stage
+from .ingest import read_export, read_header, check_required_columns
+from .archive import write_entry, parquet_entry, arrow_entry, DEFAULT_OUTPUT_FORMATS
+from .jobs import write_report_files
+from .logic import allowed_file, combine_error_counts, format_error_counts
+from .parallel import get_pool
+from .pipeline import PipelineStats, run_medor_pipeline
+
+
+# Exécution des fichiers d'un lot : 'processes' (pool de processus), 'threads' ou 'sync'
+BATCH_EXECUTOR = os.getenv('BATCH_EXECUTOR', 'processes')
+# Nombre de fichiers traités en même temps
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+# Nombre maximal de fichiers CSV dans un lot
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 100))
+
+
+def _unique_name(name, used):
+    """
+    Nom de fichier non encore utilisé dans le lot (suffixe _2, _3... en cas de doublon)
+    """
+    stem, extension = os.path.splitext(name)
+    candidate, number = name, 1
+    while candidate in used:
+        number += 1
+        candidate = f'{stem}_{number}{extension}'
+    used.add(candidate)
+    return candidate
+
+
+def save_batch_inputs(files, input_dir):
+    """
+    Enregistre les fichiers uploadés dans `input_dir` : les CSV tels quels, les CSV contenus
+    dans les archives ZIP un par un. Retourne les chemins des CSV du lot.
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    used = set()
+    paths = []
+    for file in files:
+        if file.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(file.stream) as archive:
+                for member in archive.infolist():
+                    # Seul le nom du fichier est conservé : pas d'écriture hors de input_dir
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or member.filename.startswith('__MACOSX/') or not allowed_file(name):
+                        continue
+                    path = os.path.join(input_dir, _unique_name(name, used))
+                    with archive.open(member) as source, open(path, 'wb') as target:
+                        for block in iter(lambda: source.read(2**20), b''):
+                            target.write(block)
+                    paths.append(path)
+        elif allowed_file(file.filename):
+            path = os.path.join(input_dir, _unique_name(os.path.basename(file.filename), used))
+            file.save(path)
+            paths.append(path)
+        else:
+            raise ValueError(f"Extension de fichier non autorisée : {file.filename}")
+        if len(paths) > BATCH_MAX_FILES:
+            raise ValueError(f"Trop de fichiers dans le lot (maximum {BATCH_MAX_FILES}).")
+    if not paths:
+        raise ValueError("Aucun fichier CSV dans le lot.")
+    return paths
+
+
+def process_batch_file(path, output_dir, today, formats=DEFAULT_OUTPUT_FORMATS):
+    """
+    Exécute le pipeline Medor sur un fichier du lot (dans un worker) et écrit ses rapports dans
+    `output_dir`. Retourne les chemins des fichiers écrits, les comptages KPI du fichier et les
+    mesures des étapes (publiées par le processus principal : les workers n'exposent pas de métriques).
+    """
+    file_name = "_".join(os.path.basename(path).split("_")[:3])
+    stats = PipelineStats(enabled=False)
+    df = stats.run('read_export', read_export, path, 'medor')
+    *reports, counts = run_medor_pipeline(df, stats)
+    del df
+    os.makedirs(output_dir, exist_ok=True)
+    paths = stats.run('write_report_files', write_report_files, output_dir, f'{file_name}_{today}',
+                      reports, format_error_counts(counts), formats)
+    return paths, counts, stats.stages
+
+
+def run_medor_batch(paths, work_dir, today, formats=DEFAULT_OUTPUT_FORMATS, executor=BATCH_EXECUTOR,
+                    workers=BATCH_WORKERS):
+    """
+    Traite les exports Medor d'un lot en parallèle, un fichier par worker.
+    Les en-têtes de tous les fichiers sont vérifiés avant de lancer le moindre traitement.
+    Retourne les entrées de l'archive (nom dans l'archive, chemin) : les rapports de chaque
+    fichier dans un dossier à son nom (dans les formats demandés), puis le KPI combiné de tous les
+    fichiers en CSV et, si demandés, en Parquet et en Arrow.
+    """
+    for path in paths:
+        try:
+            check_required_columns(read_header(path), 'medor')
+        except ValueError as e:
+            raise ValueError(f"{os.path.basename(path)} : {e}")
+
+    # Les processus fils du worker Celery (démons) ne peuvent pas créer de processus
+    if executor == 'processes' and multiprocessing.current_process().daemon:
+        executor = 'threads'
+    folders = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    output_dirs = [os.path.join(work_dir, 'outputs', folder) for folder in folders]
+    if executor == 'sync' or workers <= 1 or len(paths) == 1:
+        results = map(process_batch_file, paths, output_dirs, [today] * len(paths), [formats] * len(paths))
+    else:
+        results = get_pool(executor, workers).map(process_batch_file, paths, output_dirs, [today] * len(paths),
+                                                  [formats] * len(paths))
+
+    entries = []
+    counts = []
+    for folder, (file_paths, file_counts, stages) in zip(folders, results):
+        entries.extend((f'{folder}/{os.path.basename(path)}', path) for path in file_paths)
+        counts.append(file_counts)
+        for record in stages:
+            observe_stage('medor_batch', record)
+
+    df_kpi = format_error_counts(combine_error_counts(counts))
+    kpi_path = os.path.join(work_dir, f'KPI_batch_{today}.csv')
+    df_kpi.to_csv(kpi_path, index=False, encoding="utf-8", sep=";")
+    entries.append((os.path.basename(kpi_path), kpi_path))
+    for value, entry in [('parquet', parquet_entry), ('arrow', arrow_entry)]:
+        if value in formats:
+            kpi_path = write_entry(os.path.join(work_dir, f'KPI_batch_{today}.{value}'), entry(df_kpi))
+            entries.append((os.path.basename(kpi_path), kpi_path))
+    return entries
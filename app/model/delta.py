@@ -0,0 +1,140 @@
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from .pipeline import PipelineStats, classify_medor, format_medor
+
+
+# Base des empreintes d'erreurs (par défaut, la base Postgres de l'application : csv_to_db.get_engine)
+DELTA_DATABASE_URL = os.getenv('DELTA_DATABASE_URL')
+DELTA_TABLE = 'medor_error_fingerprints'
+
+# Colonnes qui identifient une erreur d'un export à l'autre
+FINGERPRINT_COLUMNS = ['ParentId', 'ErrorType', 'DataQualityType']
+NEW_STATUS = 'new'
+RESOLVED_STATUS = 'resolved'
+
+_engine = None
+
+
+def get_delta_engine():
+    """
+    Moteur SQLAlchemy de la base des empreintes, créé une seule fois
+    """
+    global _engine
+    if _engine is None:
+        if DELTA_DATABASE_URL:
+            _engine = create_engine(DELTA_DATABASE_URL)
+        else:
+            from csv_to_db.get_engine import get_engine
+            _engine = get_engine()
+    return _engine
+
+
+def ensure_fingerprint_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {DELTA_TABLE} (
+                scope TEXT NOT NULL,
+                fingerprint BIGINT NOT NULL,
+                parent_id TEXT,
+                error_type TEXT,
+                data_quality_type TEXT,
+                first_seen DATE NOT NULL,
+                last_seen DATE NOT NULL,
+                PRIMARY KEY (scope, fingerprint)
+            )
+        """))
+
+
+def error_fingerprints(df):
+    """
+    Empreinte 64 bits de chaque ligne (ParentId, ErrorType, DataQualityType), stable d'un processus
+    et d'un jour à l'autre (hash_pandas_object avec sa clé par défaut)
+    """
+    keys = df[FINGERPRINT_COLUMNS].astype(str)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy().view(np.int64)
+
+
+def load_fingerprints(engine, scope):
+    """
+    Empreintes enregistrées lors des traitements précédents d'un export
+    """
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"SELECT fingerprint, parent_id, error_type, data_quality_type, first_seen, last_seen "
+                                f"FROM {DELTA_TABLE} WHERE scope = :scope"), conn, params={'scope': scope})
+
+
+def save_fingerprints(engine, scope, today, new_rows, resolved):
+    """
+    Met à jour les empreintes d'un export en une transaction : suppression des erreurs résolues,
+    date de dernière observation des erreurs toujours présentes, ajout des nouvelles erreurs.
+    Une empreinte déjà ajoutée par un traitement simultané du même export n'est pas dupliquée :
+    seule sa date de dernière observation est mise à jour.
+    """
+    with engine.begin() as conn:
+        if len(resolved):
+            conn.execute(text(f"DELETE FROM {DELTA_TABLE} WHERE scope = :scope AND fingerprint = :fingerprint"),
+                         [{'scope': scope, 'fingerprint': fingerprint} for fingerprint in resolved['fingerprint'].tolist()])
+        conn.execute(text(f"UPDATE {DELTA_TABLE} SET last_seen = :today WHERE scope = :scope"),
+                     {'scope': scope, 'today': today})
+        if len(new_rows):
+            values = new_rows.astype(object).where(new_rows.notna(), None)
+            conn.execute(text(f"INSERT INTO {DELTA_TABLE} "
+                              f"(scope, fingerprint, parent_id, error_type, data_quality_type, first_seen, last_seen) "
+                              f"VALUES (:scope, :fingerprint, :parent_id, :error_type, :data_quality_type, :today, :today) "
+                              f"ON CONFLICT (scope, fingerprint) DO UPDATE SET last_seen = EXCLUDED.last_seen"),
+                         [{'scope': scope, 'today': today, 'fingerprint': int(fingerprint),
+                           'parent_id': parent_id, 'error_type': error_type, 'data_quality_type': data_quality_type}
+                          for fingerprint, parent_id, error_type, data_quality_type
+                          in zip(new_rows['fingerprint'], values['ParentId'], values['ErrorType'],
+                                 values['DataQualityType'])])
+
+
+def run_medor_delta(df, scope, today, engine=None, stats=None):
+    """
+    Pipeline Medor incrémental pour un export (`scope`, ex. le préfixe du nom de fichier) : les
+    erreurs déjà présentes lors du traitement précédent ne passent pas par les étapes de mise
+    en forme.
+    Retourne (doublons logiques, doublons parfaits, missing relationship, erreurs résolues,
+    comptages KPI, save) : les trois rapports ne contiennent que les nouvelles erreurs (statut 'new'),
+    les erreurs résolues sont celles du traitement précédent absentes de cet export.
+    Les comptages KPI portent sur toutes les erreurs de l'export.
+    save() enregistre les empreintes : à appeler une fois l'archive entièrement produite, pour
+    qu'un envoi interrompu ne marque pas comme déjà vues des erreurs jamais livrées.
+    """
+    stats = stats or PipelineStats()
+    engine = engine or get_delta_engine()
+    ensure_fingerprint_table(engine)
+
+    df, counts = classify_medor(df, stats)
+    fingerprints = stats.run('error_fingerprints', error_fingerprints, df)
+    previous = stats.run('load_fingerprints', load_fingerprints, engine, scope)
+
+    is_new = ~np.isin(fingerprints, previous['fingerprint'].to_numpy())
+    positions = np.flatnonzero(is_new)
+    new_rows = df[FINGERPRINT_COLUMNS].take(positions).astype(object).assign(fingerprint=fingerprints[positions])
+    new_rows = new_rows.drop_duplicates('fingerprint')
+    resolved = previous[~previous['fingerprint'].isin(fingerprints)]
+    print(f"[delta] {scope} : {len(new_rows)} nouvelles erreurs, "
+          f"{len(previous) - len(resolved)} toujours présentes, {len(resolved)} résolues")
+
+    # Seules les nouvelles lignes sont mises en forme (sans nouvelle erreur, toutes les colonnes
+    # seraient vides : elles sont conservées pour produire des rapports vides)
+    reports = format_medor(df.take(positions), stats, drop_empty_columns=len(positions) > 0, status=NEW_STATUS)
+    del df
+
+    df_resolved = pd.DataFrame({
+        'ParentId': resolved['parent_id'],
+        'ErrorType': resolved['error_type'],
+        'DataQualityType': resolved['data_quality_type'],
+        'FirstSeen': resolved['first_seen'].astype(str),
+        'LastSeen': resolved['last_seen'].astype(str),
+        'ErrorStatus': RESOLVED_STATUS,
+    }).reset_index(drop=True)
+
+    save = partial(stats.run, 'save_fingerprints', save_fingerprints, engine, scope, today, new_rows, resolved)
+    return (*reports, df_resolved, counts, save)
@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from .logic import render_blanked_cells, REPEAT_MASK_COLUMN, WRITE_CHUNK_ROWS
+
+
+# Style d'en-tête identique à celui appliqué par pandas.DataFrame.to_excel
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+# Format des dates identique à celui de pandas.ExcelWriter
+DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+
+# Onglets du rapport ALL_Errors_report, dans l'ordre des DataFrames reçus
+EXCEL_REPORT_SHEETS = ['Logical_Duplicate sheet', 'Perfect_Duplicate sheet', 'Missing_relationship sheet']
+
+
+def excel_cell_values(values):
+    """
+    Valeurs d'une colonne pour write_row, comme avec to_excel : cellules vides pour les valeurs
+    manquantes, 'inf' et '-inf' pour les infinis (inf_rep), que xlsxwriter refuse d'écrire
+    """
+    cells = values.to_numpy(dtype=object)
+    cells[pd.isna(cells)] = None
+    if values.dtype.kind == 'f':
+        numbers = values.to_numpy()
+        cells[np.isposinf(numbers)] = 'inf'
+        cells[np.isneginf(numbers)] = '-inf'
+    elif values.dtype == object:
+        cells[values.isin([np.inf]).to_numpy()] = 'inf'
+        cells[values.isin([-np.inf]).to_numpy()] = '-inf'
+    return cells
+
+
+class IncrementalExcelWriter:
+    """
+    Classeur Excel écrit ligne par ligne en mode 'constant_memory' de xlsxwriter.
+    Chaque onglet reçoit son en-tête puis des blocs de lignes successifs : la mémoire
+    utilisée ne dépend que de la taille d'un bloc, pas de la taille totale du fichier.
+    """
+
+    def __init__(self, path):
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True,
+                                                  'default_date_format': DATETIME_FORMAT})
+        self.header_format = self.workbook.add_format(HEADER_FORMAT)
+        self.sheets = {}
+
+    def add_sheet(self, sheet_name, columns):
+        """
+        Crée un onglet, écrit l'en-tête et fige la première ligne
+        """
+        worksheet = self.workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, [str(column) for column in columns], self.header_format)
+        worksheet.freeze_panes(1, 0)
+        self.sheets[sheet_name] = {'worksheet': worksheet, 'columns': list(columns), 'next_row': 1}
+        return worksheet
+
+    def append(self, sheet_name, df):
+        """
+        Ajoute les lignes du DataFrame à la suite de l'onglet, à partir des tableaux de colonnes.
+        Les champs marqués dans REPEAT_MASK_COLUMN sont vidés bloc par bloc.
+        """
+        for start in range(0, len(df), WRITE_CHUNK_ROWS):
+            self._append_rows(sheet_name, render_blanked_cells(df.iloc[start:start + WRITE_CHUNK_ROWS]))
+
+    def _append_rows(self, sheet_name, df):
+        sheet = self.sheets[sheet_name]
+        worksheet = sheet['worksheet']
+        df = df.reindex(columns=sheet['columns'])
+
+        columns = [excel_cell_values(df.iloc[:, position]) for position in range(df.shape[1])]
+
+        row = sheet['next_row']
+        for values in zip(*columns):
+            worksheet.write_row(row, 0, values)
+            row += 1
+        sheet['next_row'] = row
+
+    def close(self):
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_excel_report(df1, df2, df3, path=None):
+    """
+    Écrit le rapport ALL_Errors_report (un onglet par DataFrame, en-tête figé) dans un fichier
+    sur disque en mode 'constant_memory', sans passer par pandas.ExcelWriter ni par la mémoire.
+    Sans `path`, le classeur est créé dans un fichier temporaire à supprimer par l'appelant.
+    Retourne le chemin du fichier.
+    """
+    if path is None:
+        handle, path = tempfile.mkstemp(prefix='ALL_Errors_report_', suffix='.xlsx')
+        os.close(handle)
+    with IncrementalExcelWriter(path) as excel_writer:
+        for sheet_name, df in zip(EXCEL_REPORT_SHEETS, (df1, df2, df3)):
+            columns = df.columns.drop(REPEAT_MASK_COLUMN, errors='ignore')
+            excel_writer.add_sheet(sheet_name, columns)
+            excel_writer.append(sheet_name, df)
+    return path
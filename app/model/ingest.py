@@ -0,0 +1,127 @@
+import csv
+
+import pandas as pd
+
+from .logic import MEDOR_UNUSED_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow absent : lecture avec le moteur C de pandas
+    pa = None
+
+
+# Colonnes lues par chaque pipeline :
+# - required : colonnes sans lesquelles le pipeline ne peut pas tourner (vérifiées avant toute lecture)
+# - dtypes : colonnes texte déclarées (ni inférence, ni conversion en date)
+# - unused : colonnes supprimées par le pipeline, qui ne sont pas lues
+INGEST_SCHEMAS = {
+    'medor': {
+        'required': ['traceId', 'TraceType', '_ErrorMessage', 'createdAt', 'Manufacturer'],
+        'dtypes': {'traceId': str, 'TraceType': str, '_ErrorMessage': str, 'createdAt': str, 'Manufacturer': str},
+        'unused': MEDOR_UNUSED_COLUMNS,
+    },
+    'carlsberg': {
+        'required': ['traceId', 'TraceType', '_ErrorMessage'],
+        'dtypes': {'traceId': str, 'TraceType': str, '_ErrorMessage': str},
+        'unused': [],
+    },
+}
+
+# Lecture exacte des décimaux avec le moteur C de pandas, comme pyarrow (par défaut, le dernier
+# chiffre peut différer)
+FLOAT_PRECISION = 'round_trip'
+
+# Valeurs reconnues comme booléens par pandas (pyarrow accepte aussi '1' et '0' par défaut)
+TRUE_VALUES = ['True', 'TRUE', 'true']
+FALSE_VALUES = ['False', 'FALSE', 'false']
+
+
+def read_header(source, sep=';'):
+    """
+    Lit la ligne d'en-tête d'un CSV (chemin ou fichier) sans consommer le fichier
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as csv_file:
+            line = csv_file.readline()
+    else:
+        position = source.tell()
+        line = source.readline()
+        source.seek(position)
+    if isinstance(line, bytes):
+        line = line.decode('utf-8-sig')
+    return next(csv.reader([line.lstrip('﻿').rstrip('\r\n')], delimiter=sep), [])
+
+
+def check_required_columns(columns, pipeline):
+    """
+    Vérifie la présence des colonnes obligatoires du pipeline avant tout traitement
+    """
+    missing = [column for column in INGEST_SCHEMAS[pipeline]['required'] if column not in columns]
+    if missing:
+        raise ValueError(f"Colonnes obligatoires absentes de l'export {pipeline} : {', '.join(missing)}. "
+                         f"Vérifiez le séparateur ';' et l'en-tête du fichier.")
+
+
+def ingest_columns(source, pipeline):
+    """
+    Colonnes à lire pour un pipeline, après vérification des colonnes obligatoires
+    """
+    columns = read_header(source)
+    check_required_columns(columns, pipeline)
+    unused = set(INGEST_SCHEMAS[pipeline]['unused'])
+    return [column for column in columns if column not in unused]
+
+
+def _read_pyarrow(source, usecols, dtypes):
+    """
+    Lecture multi-thread avec pyarrow.csv, avec les mêmes conversions que le moteur C de pandas :
+    les colonnes que pyarrow convertirait en date ou en heure sont relues en texte
+    """
+    def read(column_types, include_columns):
+        if not isinstance(source, str):
+            source.seek(0)
+        return pa_csv.read_csv(
+            source,
+            parse_options=pa_csv.ParseOptions(delimiter=';'),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=include_columns,
+                column_types=column_types,
+                strings_can_be_null=True,
+                true_values=TRUE_VALUES,
+                false_values=FALSE_VALUES,
+            ),
+        )
+
+    column_types = {column: pa.string() for column in dtypes if column in usecols}
+    table = read(column_types, usecols)
+    temporal = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal:
+        texts = read({column: pa.string() for column in temporal}, temporal)
+        for column in temporal:
+            table = table.set_column(table.schema.get_field_index(column), column, texts[column])
+    # Colonnes entièrement vides : float (NaN) comme avec le moteur C
+    for index, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(pa.float64()))
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    # Les valeurs manquantes des colonnes texte sont None avec pyarrow, NaN avec le moteur C
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        if values.hasnans:
+            df[column] = values.where(values.notna(), float('nan'))
+    return df
+
+
+def read_export(source, pipeline):
+    """
+    Lit un export Medor ou Carlsberg : vérifie les colonnes obligatoires, ne lit que les colonnes
+    utiles au pipeline, déclare les colonnes texte et utilise le moteur pyarrow s'il est installé
+    """
+    source = getattr(source, 'stream', source)
+    usecols = ingest_columns(source, pipeline)
+    dtypes = INGEST_SCHEMAS[pipeline]['dtypes']
+    if pa is not None:
+        return _read_pyarrow(source, usecols, dtypes)
+    return pd.read_csv(source, sep=";", low_memory=False, usecols=usecols, float_precision=FLOAT_PRECISION,
+                       dtype={column: dtype for column, dtype in dtypes.items() if column in usecols})
@@ -0,0 +1,99 @@
+import os
+import shutil
+import time
+
+from .archive import write_zip_file, write_entry, file_entry, report_entries, DEFAULT_OUTPUT_FORMATS
+from .ingest import read_export
+from .logic import format_error_counts
+from .pipeline import PIPELINE_STAGES, PipelineStats, run_medor_pipeline, run_carlsberg_pipeline
+
+
+# Répertoire partagé entre le conteneur web et le worker Celery (volume shared_tmp)
+SHARED_DIR = os.getenv('SHARED_DIR', '/tmp/shared')
+# Répertoire des traitements d'upload en arrière-plan : un sous-dossier par tâche
+JOBS_DIR = os.path.join(SHARED_DIR, 'jobs')
+# Durée de conservation des fichiers d'une tâche terminée (heures)
+JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', 24))
+
+# Nom du fichier uploadé dans le dossier de la tâche
+JOB_UPLOAD_NAME = 'upload.csv'
+
+
+def create_job_dir(task_id):
+    """
+    Crée le dossier d'une tâche et supprime les dossiers des tâches plus anciennes que JOB_RETENTION_HOURS
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    limit = time.time() - JOB_RETENTION_HOURS * 3600
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < limit:
+            shutil.rmtree(path, ignore_errors=True)
+
+    job_dir = os.path.join(JOBS_DIR, task_id)
+    os.makedirs(job_dir)
+    return job_dir
+
+
+def stage_progress(pipeline, stage, start=10, end=80):
+    """
+    Pourcentage de progression au début d'une étape du pipeline, réparti entre `start` et `end`
+    """
+    stages = PIPELINE_STAGES[pipeline]
+    position = stages.index(stage) if stage in stages else 0
+    return start + int(position / len(stages) * (end - start))
+
+
+def write_report_files(directory, suffix, reports, df_kpi=None, formats=DEFAULT_OUTPUT_FORMATS):
+    """
+    Écrit dans `directory` les fichiers de l'archive d'un pipeline dans les formats demandés
+    (voir report_entries). Retourne les chemins dans l'ordre de l'archive.
+    """
+    return [write_entry(os.path.join(directory, name), writer)
+            for name, writer in report_entries(suffix, reports, df_kpi, formats)]
+
+
+def run_upload_job(pipeline, job_dir, file_name, today, progress=None, formats=None):
+    """
+    Exécute le pipeline Medor ou Carlsberg sur le fichier uploadé du dossier de la tâche et écrit
+    l'archive ZIP (mêmes fichiers que la route synchrone) dans ce dossier.
+    `progress(pourcentage, message)` est appelé au début de chaque étape.
+    `formats` : formats de sortie (voir report_entries), CSV et Excel par défaut.
+    Retourne le chemin de l'archive.
+    """
+    progress = progress or (lambda percent, message: None)
+
+    def on_stage(stage):
+        # La lecture et l'écriture des rapports ont leur propre message de progression
+        if stage in PIPELINE_STAGES[pipeline]:
+            progress(stage_progress(pipeline, stage), f'Étape {stage}')
+
+    progress(5, 'Lecture du fichier')
+    csv_path = os.path.join(job_dir, JOB_UPLOAD_NAME)
+    stats = PipelineStats(on_stage=on_stage, pipeline=pipeline)
+    df = stats.run('read_export', read_export, csv_path, pipeline)
+
+    if pipeline == 'medor':
+        suffix = f'{file_name}_{today}'
+        *reports, counts = run_medor_pipeline(df, stats)
+        df_kpi = format_error_counts(counts)
+    else:
+        suffix = file_name
+        reports = run_carlsberg_pipeline(df, stats)
+        df_kpi = None
+    del df
+    if stats.enabled:
+        stats.report()
+
+    progress(80, 'Écriture des rapports')
+    paths = stats.run('write_report_files', write_report_files, job_dir, suffix, reports, df_kpi,
+                      formats or DEFAULT_OUTPUT_FORMATS)
+
+    progress(90, 'Création du fichier ZIP')
+    zip_path = write_zip_file(os.path.join(job_dir, f'filtered_data_{file_name}.zip'),
+                              [(os.path.basename(path), file_entry(path)) for path in paths])
+
+    # Seule l'archive est conservée pour le téléchargement
+    for path in paths + [csv_path]:
+        os.remove(path)
+    return zip_path
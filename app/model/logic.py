@@ -2,7 +2,7 @@ import re
 import pandas as pd 
 import numpy as np
 import os
-from io import BytesIO
+from io import BytesIO, StringIO
 
 
 
@@ -27,15 +27,17 @@ def remove_duplicates(df):
     return df[~df.duplicated(subset=subset_cols, keep=False)]
 
 
-def keep_first_occurrence_for_missing_relationship(df,col_name):
+# Colonne booléenne (creuse) qui marque les lignes dont les champs hors composition sont à vider
+REPEAT_MASK_COLUMN = 'is_repeat'
+
+
+def first_occurrence_kept_columns(columns):
     """
-    Conserve uniquement la première occurrence du traceId et des champs de compositions
+    Masque des colonnes conservées sur toutes les occurrences : champs de composition ('C.'),
+    ParentType, TraceNumber, TraceType, colonnes '->' et ErrorType
     """
-    # Filtrer les lignes où 'ErrorType' commence par "Missing relationship"
-    df_missing_relationship = df[df['ErrorType'].str.startswith('Missing relationship')]
-
     # Garder uniquement les colonnes qui commencent par 'C.'
-    columns_to_keep = df.columns[df.columns.str.startswith('C.')].tolist()
+    columns_to_keep = columns[columns.str.startswith('C.')].tolist()
 
     # Ajouter des colonnes spécifiques à la liste
     columns_to_keep.append('ParentType')
@@ -43,35 +45,126 @@ def keep_first_occurrence_for_missing_relationship(df,col_name):
     columns_to_keep.append('TraceType')
 
     # Ajouter les colonnes dont le nom contient '->'
-    columns_with_arrow = df.columns[df.columns.str.contains('->', regex=False)].tolist()
+    columns_with_arrow = columns[columns.str.contains('->', regex=False)].tolist()
     columns_to_keep.extend(columns_with_arrow)
 
     # Créer un masque pour garder seulement les colonnes qui sont dans 'columns_to_keep' ou qui sont 'ErrorType'
-    mask = df.columns.isin(columns_to_keep) | (df.columns == 'ErrorType')
+    return columns.isin(columns_to_keep) | (columns == 'ErrorType') | (columns == REPEAT_MASK_COLUMN)
 
-    # Garder la première occurrence de chaque TraceId
 
-    first_occurrence_idx = df_missing_relationship[col_name].drop_duplicates(keep='first').index
+def keep_first_occurrence_for_missing_relationship(df,col_name, seen=None, copy=True, blank='string'):
+    """
+    Conserve uniquement la première occurrence du traceId et des champs de compositions.
+    Si `seen` est fourni (ensemble d'identifiants déjà rencontrés, par exemple dans un bloc
+    précédent), ces identifiants ne sont plus considérés comme des premières occurrences et
+    l'ensemble est complété avec les identifiants du DataFrame.
+    Avec copy=False, le DataFrame reçu est modifié sur place s'il ne contient que des missing relationship.
+    Avec blank='mask', les colonnes gardent leur type : les occurrences suivantes sont seulement
+    marquées dans la colonne REPEAT_MASK_COLUMN et vidées à l'écriture (render_blanked_cells).
+    """
+    # Filtrer les lignes où 'ErrorType' commence par "Missing relationship"
+    is_missing_relationship = df['ErrorType'].str.startswith('Missing relationship').fillna(False).to_numpy(dtype=bool)
+    if copy or not is_missing_relationship.all():
+        df_missing_relationship = df[is_missing_relationship]
+    else:
+        df_missing_relationship = df
+
+    mask = first_occurrence_kept_columns(df_missing_relationship.columns)
+
+    # Garder la première occurrence de chaque TraceId
+    ids = df_missing_relationship[col_name]
+    first_occurrence = ~ids.duplicated(keep='first').to_numpy()
+    if seen is not None:
+        first_occurrence &= ~ids.isin(seen).to_numpy()
+        seen.update(ids.unique())
 
    # Copier le DataFrame pour le modifier
-    df_missing_relationship_masked = df_missing_relationship.copy()
+    df_missing_relationship_masked = df_missing_relationship.copy() if copy else df_missing_relationship
+
+    if blank == 'mask':
+        df_missing_relationship_masked[REPEAT_MASK_COLUMN] = pd.arrays.SparseArray(~first_occurrence, fill_value=False)
+        return df_missing_relationship_masked
 
     # Convertir les colonnes non incluses dans le masque en type 'object' pour permettre l'affectation de chaînes vides
     cols_to_convert = df_missing_relationship_masked.columns[~mask].tolist()
     df_missing_relationship_masked[cols_to_convert] = df_missing_relationship_masked[cols_to_convert].astype(object)
 
     # Garder les valeurs pour la première occurrence de chaque TraceId et les autres valeurs à une chaîne vide
-    df_missing_relationship_masked.loc[~df_missing_relationship_masked.index.isin(first_occurrence_idx), ~mask] = ''
+    df_missing_relationship_masked.loc[~first_occurrence, ~mask] = ''
     
     
     return df_missing_relationship_masked
 
-def add_columns_and_remove(df):
+
+def render_blanked_cells(df):
+    """
+    Remplace par '' les champs marqués dans REPEAT_MASK_COLUMN et retire la colonne de masque.
+    Utilisé uniquement au moment de l'écriture, idéalement sur des blocs de lignes.
+    """
+    if REPEAT_MASK_COLUMN not in df.columns:
+        return df
+    repeated = df[REPEAT_MASK_COLUMN].to_numpy(dtype=bool)
+    df = df.drop(columns=[REPEAT_MASK_COLUMN])
+    if not repeated.any():
+        return df
+    blanked = df.columns[~first_occurrence_kept_columns(df.columns)]
+    df[blanked] = df[blanked].astype(object)
+    df.loc[repeated, blanked] = ''
+    return df
+
+
+# Nombre de lignes rendues à la fois lors de l'écriture des CSV et des onglets Excel
+WRITE_CHUNK_ROWS = 50000
+
+
+def iter_csv_chunks(df, buffer):
+    """
+    Écrit le DataFrame en CSV ';' (UTF-8, sans index) dans `buffer` par blocs de lignes, en vidant
+    les champs marqués dans REPEAT_MASK_COLUMN. Générateur : rend la main après chaque bloc écrit.
+    """
+    for start in range(0, max(len(df), 1), WRITE_CHUNK_ROWS):
+        chunk = render_blanked_cells(df.iloc[start:start + WRITE_CHUNK_ROWS])
+        chunk.to_csv(buffer, index=False, encoding="utf-8", sep=";", header=start == 0)
+        yield
+
+
+def dataframe_to_csv(df, path_or_buf=None):
+    """
+    Écrit le DataFrame en CSV ';' (UTF-8, sans index) par blocs de lignes, en vidant les
+    champs marqués dans REPEAT_MASK_COLUMN. Retourne le texte si aucun fichier n'est fourni.
+    """
+    buffer = StringIO() if path_or_buf is None else path_or_buf
+    for _ in iter_csv_chunks(df, buffer):
+        pass
+    return buffer.getvalue() if path_or_buf is None else None
+
+
+def dataframe_to_excel(df, writer, sheet_name):
+    """
+    Écrit le DataFrame dans un onglet par blocs de lignes, en vidant les champs marqués
+    dans REPEAT_MASK_COLUMN
+    """
+    for start in range(0, max(len(df), 1), WRITE_CHUNK_ROWS):
+        chunk = render_blanked_cells(df.iloc[start:start + WRITE_CHUNK_ROWS])
+        chunk.to_excel(writer, sheet_name=sheet_name, index=False,
+                       header=start == 0, startrow=0 if start == 0 else start + 1)
+
+
+# Colonnes de l'export Medor supprimées par add_columns_and_remove (createdAt est supprimée après usage)
+MEDOR_UNUSED_COLUMNS = ['hours_since_error', 'businessName', '_ErrorCode', 'formatted_supplier',
+                        'C.preceding_event_number_rnm01_first_part',
+                        'C.preceding_event_number_rnm01_second_part',
+                        'C.formatted_preceding_article_supplier']
+
+
+def add_columns_and_remove(df, copy=True):
     """
     Ajoute de nouvelles colonnes au DataFrame et supprime des colonnes inutiles.
+    Avec copy=False, le DataFrame reçu est modifié sur place.
     """
     # Faire une copie du DataFrame pour éviter les avertissements "SettingWithCopyWarning"
-    df = df.copy()
+    if copy:
+        df = df.copy()
     if 'ParentType' in df.columns and 'ParentNumber' in df.columns:
 
         # Ajouter une colonne TraceType avec "DATA-QUALITY-" + contenu de ParentType
@@ -85,64 +178,90 @@ def add_columns_and_remove(df):
 
     # Supprimer les colonnes hours_since_error, businessName et createdAt
 
-    df.drop(['hours_since_error', 'businessName', 'createdAt','_ErrorCode','formatted_supplier',
-            'C.preceding_event_number_rnm01_first_part','C.preceding_event_number_rnm01_second_part',
-            'C.formatted_preceding_article_supplier'], axis=1, inplace=True, errors='ignore')
+    df.drop(MEDOR_UNUSED_COLUMNS + ['createdAt'], axis=1, inplace=True, errors='ignore')
 
     return df
 
 
 
-def modify_error_type(df):
+# Expressions régulières compilées une seule fois pour la réécriture des missing relationship
+LOT_NAME_PATTERNS = (
+    re.compile(r'\b([a-zA-Z]*Number[a-zA-Z]*)\b'),
+    re.compile(r'\b([a-zA-Z]*Code[a-zA-Z]*)\b'),
+)
+LOT_VALUE_PATTERNS = (
+    re.compile(r'\b\w*Number\w*\s*:\s*([^\s\)]+)'),
+    re.compile(r'\b\w*Code\w*\s*:\s*([^\s\)]+)'),
+)
+UPPER_WORD_PATTERN = re.compile(r'\b([A-Z]+(?:-[A-Z]+)*)\b')
+
+
+def extract_word(text):
+    """
+    Extrait le premier mot en majuscules (ex: MATERIAL-RECEPTION) d'un nom de colonne
+    """
+    match = UPPER_WORD_PATTERN.search(text)
+    return match.group(1) if match else ''
+
+
+def _extract_first(parts, patterns):
+    """
+    Extrait le groupe du premier motif qui correspond, pour chaque élément de la Series
+    """
+    result = parts.str.extract(patterns[0], expand=False)
+    for pattern in patterns[1:]:
+        # where plutôt que fillna : pas de conversion implicite du type object (dépréciée par pandas)
+        result = result.where(result.notna(), parts.str.extract(pattern, expand=False))
+    return result
+
+
+def _non_empty_text_positions(values):
+    """
+    Retourne les positions des cellules qui contiennent une chaîne non vide
+    """
+    if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+        return np.array([], dtype=np.intp)
+    stripped = pd.Series(values.to_numpy(), dtype=object).str.strip()
+    return np.flatnonzero(stripped.notna().to_numpy() & stripped.ne('').to_numpy())
+
+
+def modify_error_type(df, copy=True):
     """
     Modifie les messages d'erreur pour les rendre plus explicites pour les missing relationship 
+    Avec copy=False, le DataFrame reçu est modifié sur place.
     """
     # Faire une copie du DataFrame pour éviter les avertissements "SettingWithCopyWarning"
-    df = df.copy()
-
-    # Fonction pour extraire le nom du lot du message d'erreur
-    def extract_lot_name(text):
-        match = re.search(r'\b([a-zA-Z]*Number[a-zA-Z]*)\b', text)
-        if not match:
-            match = re.search(r'\b([a-zA-Z]*Code[a-zA-Z]*)\b', text)
-        return match.group(1) if match else ''
-    
-    def extract_word(text):
-        match = re.search(r'\b([A-Z]+(?:-[A-Z]+)*)\b', text)
-        if match:
-            return match.group(1)
-        else:
-            return ''
-        
-    # Fonction pour extraire la valeur du lot, qui suit immédiatement le nom du lot et se termine avant un espace ou une parenthèse
-    def extract_lot_value(value):
-        match = re.search(r'\b\w*Number\w*\s*:\s*([^\s\)]+)', value)
-        if not match : 
-            match = re.search(r'\b\w*Code\w*\s*:\s*([^\s\)]+)', value)
-        return match.group(1) if match else ''
-    
+    if copy:
+        df = df.copy()
+
     # Identifier toutes les colonnes qui contiennent '->'
     arrow_columns = [col for col in df.columns if '->' in col]
-   
-    # Fonction pour modifier le message d'erreur
-    def modify_message(row):
-        for col in arrow_columns:
-            if isinstance(row[col], str) and row[col].strip():  # Vérifier si la cellule a une valeur non vide
-                parts = row[col].split(',')
-                modified_parts = []
-                for part in parts:
-                    word = extract_word(col)
-                    lot_name = extract_lot_name(part)
-                    lot_value = extract_lot_value(part)
-                    if lot_name:
-                        new_message = f"{lot_name} {lot_value} not found in {word}"
-                        modified_parts.append(new_message)
-                # Recombiner les parties modifiées en une seule chaîne, séparées par des virgules
-                row[col] = ',\n'.join(modified_parts)
-        return row
-
-    df = df.apply(modify_message, axis=1)
-    
+
+    for col in arrow_columns:
+        positions = _non_empty_text_positions(df[col])
+        if len(positions) == 0:
+            continue
+        # Le mot de la colonne ne dépend que de son nom : il est calculé une seule fois
+        word = extract_word(col)
+
+        # Découper chaque cellule en parties séparées par des virgules (une ligne par partie)
+        values = df[col].to_numpy()
+        parts = pd.Series(values[positions], index=positions, dtype=object).str.split(',').explode()
+
+        lot_name = _extract_first(parts, LOT_NAME_PATTERNS)
+        lot_value = _extract_first(parts, LOT_VALUE_PATTERNS).fillna('')
+
+        # Seules les parties contenant un nom de lot produisent un message
+        found = lot_name.notna()
+        messages = lot_name[found].astype(object) + ' ' + lot_value[found] + f' not found in {word}'
+
+        # Recombiner les parties modifiées en une seule chaîne, séparées par des virgules
+        rewritten = messages.groupby(level=0).agg(',\n'.join).reindex(positions, fill_value='')
+
+        new_values = values.astype(object)
+        new_values[positions] = rewritten.to_numpy()
+        df[col] = new_values
+
     # Supprimer la colonne d'erreur d'origine
     df.drop(columns=['ErrorType'], inplace=True)
 
@@ -150,45 +269,37 @@ def modify_error_type(df):
 
 
 
+# Expression régulière pour capturer les types d'erreur avec leur contenu entre parenthèses
+MISSING_RELATIONSHIP_PATTERN = re.compile(r'(\b\w+(?:-\w+)?->\w+(?:-\w+)?) \(([^)]+)\)')
+
+
 def extract_error_types(error_type):
-    # Expression régulière pour capturer les types d'erreur avec leur contenu entre parenthèses
-    pattern = r'(\b\w+(?:-\w+)?->\w+(?:-\w+)?) \(([^)]+)\)'
-    error_types = re.findall(pattern, error_type)
+    error_types = MISSING_RELATIONSHIP_PATTERN.findall(error_type)
     return error_types
 
 
 def sort_missing_relationships(df):
-    """f
+    """
     Trie et organise les erreurs de relations manquantes dans des colonnes dédiées
     """
-    # Dictionnaire pour accumuler les colonnes d'erreurs uniques
-    error_columns = {}
-
-    # Vérifiez la longueur du DataFrame
-    df_len = len(df)
-
-    # Parcourir chaque ligne du DataFrame
-    for index, row in df.iterrows():
-        # Extraire les types d'erreur de l'erreur actuelle
-        current_error_types = extract_error_types(row['ErrorType'])
-        for error_type, content in current_error_types:
-            # Créer la colonne si elle n'existe pas déjà
-            if error_type not in error_columns:
-                error_columns[error_type] = [''] * df_len  # Assurez-vous que la longueur correspond au DataFrame
-
-            # Ajouter le contenu spécifique à cette occurrence d'erreur
-            if index < df_len:  # Vérifiez que l'index est bien dans les limites
-                if error_columns[error_type][index]:
-                    error_columns[error_type][index] += ',\n' + f"{error_type} ({content})"
-                else:
-                    error_columns[error_type][index] = f"{error_type} ({content})"
-            else:
-                # Log en cas de problème d'index
-                print(f"Problème d'index : {index} est hors des limites pour {error_type}")
-
-    # Ajouter les colonnes d'erreur au DataFrame
-    for error_type, contents in error_columns.items():
-        df[error_type] = contents
+    # Travailler en positions (0..n-1) pour ne pas dépendre de l'index du DataFrame
+    error_types = pd.Series(df['ErrorType'].to_numpy(), dtype=object)
+
+    # Extraire en une seule passe toutes les occurrences "X->Y (contenu)" de chaque ligne
+    matches = error_types.str.extractall(MISSING_RELATIONSHIP_PATTERN)
+    if matches.empty:
+        return df
+
+    positions = matches.index.get_level_values(0)
+    labels = matches[0] + ' (' + matches[1] + ')'
+
+    # Regrouper les occurrences par ligne et par type d'erreur, dans l'ordre d'apparition
+    grouped = labels.groupby([positions, matches[0].to_numpy()], sort=False).agg(',\n'.join)
+    error_columns = grouped.unstack(fill_value='').reindex(range(len(df)), fill_value='')
+
+    # Ajouter les colonnes d'erreur au DataFrame dans l'ordre de première apparition
+    for error_type in pd.unique(matches[0]):
+        df[error_type] = error_columns[error_type].to_numpy()
 
     return df
 
@@ -220,16 +331,97 @@ def rename_medor(df):
     df.rename(columns={'TraceType': 'ParentType', 'TraceNumber': 'ParentNumber', 'traceId': 'ParentId'}, inplace=True)
     return df
 
+# Familles d'erreur utilisées pour répartir les lignes dans les différents rapports
+LOGICAL_DUPLICATE = 'Logical Duplicate'
+PERFECT_DUPLICATE = 'Perfect Duplicate'
+MISSING_RELATIONSHIP = 'Missing relationship'
+OTHER_ERROR = 'Other'
+ERROR_FAMILIES = [LOGICAL_DUPLICATE, PERFECT_DUPLICATE, MISSING_RELATIONSHIP, OTHER_ERROR]
+ERROR_FAMILY_PREFIXES = [
+    ('Logical Duplicate with', LOGICAL_DUPLICATE),
+    ('Perfect Duplicate with', PERFECT_DUPLICATE),
+    ('Missing relationship', MISSING_RELATIONSHIP),
+]
+
+KPI_TYPES = ['Duplicate', 'Missing Relationship']
+
+# Règles DataQualityType par ordre de priorité décroissante (la première qui correspond l'emporte)
+DATA_QUALITY_RULES = [
+    ('PAIRING->trace', 'no_prod_in_pairing'),
+    ('trace ->PRODUCTION', 'no_prod_in_prod'),
+    ('trace ->MATERIAL-RECEPTION', 'mat-rec_not-found'),
+    ('PRODUCTION->trace', 'rec_no_prod'),
+    ('Duplicate', 'Duplicates'),
+]
+DATA_QUALITY_TYPES = ['not defined'] + [quality_type for _, quality_type in reversed(DATA_QUALITY_RULES)]
+
+# Colonnes de travail ajoutées par classify_errors et retirées avant l'écriture des rapports
+CLASSIFICATION_COLUMNS = ['ErrorFamily', 'KPIType']
+
+
+def classify_error_message(message):
+    """
+    Retourne la famille d'erreur, le type KPI et le DataQualityType d'un ErrorType
+    """
+    if not isinstance(message, str):
+        return OTHER_ERROR, None, 'not defined'
+
+    family = OTHER_ERROR
+    for prefix, prefix_family in ERROR_FAMILY_PREFIXES:
+        if message.startswith(prefix):
+            family = prefix_family
+            break
+
+    kpi_type = 'Missing Relationship' if 'Missing' in message else 'Duplicate'
+
+    data_quality_type = 'not defined'
+    for pattern, quality_type in DATA_QUALITY_RULES:
+        if pattern in message:
+            data_quality_type = quality_type
+            break
+
+    return family, kpi_type, data_quality_type
+
+
+def classify_errors(df):
+    """
+    Classe chaque ErrorType en une seule passe : ajoute les colonnes catégorielles
+    ErrorFamily, KPIType et DataQualityType
+    """
+    # Chaque message distinct n'est analysé qu'une seule fois
+    codes, uniques = pd.factorize(df['ErrorType'])
+    classes = [classify_error_message(message) for message in uniques]
+    classes.append(classify_error_message(None))  # code -1 : ErrorType manquant
+    codes = np.where(codes < 0, len(classes) - 1, codes)
+
+    for column, position, categories in [('ErrorFamily', 0, ERROR_FAMILIES),
+                                         ('KPIType', 1, KPI_TYPES),
+                                         ('DataQualityType', 2, DATA_QUALITY_TYPES)]:
+        category_codes = np.array(
+            [categories.index(c[position]) if c[position] is not None else -1 for c in classes]
+        )
+        df[column] = pd.Categorical.from_codes(category_codes[codes], categories=categories)
+    return df
+
+
+def split_error_families(df):
+    """
+    Répartit les lignes en doublons logiques, doublons parfaits et relations manquantes
+    à partir de la colonne ErrorFamily. Chaque DataFrame retourné possède ses propres données
+    et peut être modifié sur place.
+    """
+    families = df['ErrorFamily'].to_numpy()
+    df = df.drop(columns=CLASSIFICATION_COLUMNS)
+    return tuple(df.take(np.flatnonzero(families == family))
+                 for family in (LOGICAL_DUPLICATE, PERFECT_DUPLICATE, MISSING_RELATIONSHIP))
+
+
 def ajouter_data_quality_type(df):
     """
     Ajouter la colonne DataQualityType
     """
-    df['DataQualityType'] = 'not defined'
-    df.loc[df['ErrorType'].str.contains('Duplicate'), 'DataQualityType'] = 'Duplicates'
-    df.loc[df['ErrorType'].str.contains('PRODUCTION->trace'), 'DataQualityType'] = 'rec_no_prod'
-    df.loc[df['ErrorType'].str.contains('trace ->MATERIAL-RECEPTION'), 'DataQualityType'] = 'mat-rec_not-found'
-    df.loc[df['ErrorType'].str.contains('trace ->PRODUCTION'), 'DataQualityType'] = 'no_prod_in_prod'
-    df.loc[df['ErrorType'].str.contains('PAIRING->trace'), 'DataQualityType'] = 'no_prod_in_pairing'
+    if 'DataQualityType' not in df.columns:
+        df = classify_errors(df)
     return df
 
 
@@ -239,125 +431,157 @@ def save_dfs_to_excel(df1,df2,df3, excel_buffer):
     """
     with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
         # Écrire le DataFrame 1 et figer la première ligne
-        df1.to_excel(writer, sheet_name='Logical_Duplicate sheet', index=False)
+        dataframe_to_excel(df1, writer, 'Logical_Duplicate sheet')
         worksheet1 = writer.sheets['Logical_Duplicate sheet']
         worksheet1.freeze_panes(1, 0)  # Figer la première ligne de l'onglet 'Logical_Duplicate sheet'
 
         # Écrire le DataFrame 2 et figer la première ligne
-        df2.to_excel(writer, sheet_name='Perfect_Duplicate sheet', index=False)
+        dataframe_to_excel(df2, writer, 'Perfect_Duplicate sheet')
         worksheet2 = writer.sheets['Perfect_Duplicate sheet']
         worksheet2.freeze_panes(1, 0)  # Figer la première ligne de l'onglet 'Perfect_Duplicate sheet'
 
         # Écrire le DataFrame 3 et figer la première ligne
-        df3.to_excel(writer, sheet_name='Missing_relationship sheet', index=False)
+        dataframe_to_excel(df3, writer, 'Missing_relationship sheet')
         worksheet3 = writer.sheets['Missing_relationship sheet']
         worksheet3.freeze_panes(1, 0)  # Figer la première ligne de l'onglet 'Missing_relationship sheet'
 
-def count_errors_by_type_and_manufacturer(df):
+KPI_GROUP_COLUMNS = ['ParentType', 'Manufacturer', 'Date', 'KPIType']
+
+
+def count_error_occurrences(df):
     """
-    Transforme un DataFrame pour compter les occurrences de types d'erreurs par manufacture et par date,
-    et ajoute un résumé des totaux par manufacture et par type d'erreur sans considération des dates.
+    Compte les erreurs par ParentType, Manufacturer, date et type KPI (Series indexée par ces colonnes)
     """
-    new_df = df.copy()
-    new_df['ParentType'] = df['ParentType']
-    new_df['Date'] = pd.to_datetime(df['createdAt']).dt.date
+    # Seules les colonnes du groupement sont nécessaires : pas de copie complète du DataFrame
+    new_df = pd.DataFrame({'ParentType': df['ParentType'], 'Manufacturer': df['Manufacturer'],
+                           'Date': pd.to_datetime(df['createdAt']).dt.date})
 
-    # Détermination du type d'erreur
-    new_df['KPIType'] = df['ErrorType'].apply(lambda x: 'Missing Relationship' if 'Missing' in x else 'Duplicate')
+    # Détermination du type d'erreur (réutilise la classification si elle a déjà été faite)
+    if 'KPIType' in df.columns:
+        new_df['KPIType'] = df['KPIType']
+    else:
+        new_df['KPIType'] = classify_errors(df[['ErrorType']].copy())['KPIType']
 
     # Groupement initial par TraceType, Manufacturer, Date et ErrorType
-    new_df = new_df.groupby(['ParentType', 'Manufacturer', 'Date', 'KPIType']).size().reset_index(name='Count')
+    return new_df.groupby(KPI_GROUP_COLUMNS, observed=True).size()
+
+
+def combine_error_counts(counts):
+    """
+    Additionne des comptages produits par count_error_occurrences (blocs ou fichiers différents)
+    """
+    return pd.concat(counts).groupby(level=KPI_GROUP_COLUMNS, observed=True).sum()
+
+
+def format_error_counts(counts):
+    """
+    Construit le DataFrame KPI-MONITORING à partir des comptages par type d'erreur
+    """
+    new_df = counts.reset_index(name='Count')
     new_df.insert(loc=0, column='TraceType', value='KPI-MONITORING')
     new_df.insert(loc=1 , column ='TraceNumber',value=np.arange(1, len(new_df) + 1))
     new_df['Deactivated'] = "False"
 
     return new_df
 
-def modify_error_type_carl(df):
+
+def count_errors_by_type_and_manufacturer(df):
+    """
+    Transforme un DataFrame pour compter les occurrences de types d'erreurs par manufacture et par date,
+    et ajoute un résumé des totaux par manufacture et par type d'erreur sans considération des dates.
+    """
+    return format_error_counts(count_error_occurrences(df))
+
+# Règles de traduction Carlsberg : (TraceType, sens de la flèche) -> remplacements appliqués dans l'ordre.
+# Le sens de la flèche est cherché dans le nom de la colonne ('->' s'applique à toutes les colonnes).
+CARLSBERG_RULES = {
+    ("BRASSERIE-COND", "->"): [("NumeroLotProductionSource", "NumeroLotProduction")],
+    ("BRASSERIE-OF", "trace->BRASSERIE-REC"): [("C.NumeroLotSource", "NumeroLotReception ")],
+    ("BRASSERIE-OF", "trace->BRASSERIE-OF"): [("C.NumeroLotSource", "NumeroLotProduction")],
+    ("BRASSERIE-OF", "BRASSERIE-COND->trace"): [("NumeroLotProduction", "NumeroLotProductionSource ")],
+    ("BRASSERIE-OF", "BRASSERIE-OF->trace"): [("NumeroLotProduction", "C.NumeroLotSource")],
+    ("BRASSERIE-REC", "trace->MALTERIE-EXP"): [("BonLivraison", "NumeroBL")],
+    ("BRASSERIE-REC", "BRASSERIE-OF->trace"): [("NumeroLotReception", "C.NumeroLotSource")],
+    ("MALTERIE-EXP", "trace->MALTERIE-OF"): [("C.PredecesseurCelluleOrigine", "CelluleDestination"),
+                                             ("C.Predecesseur", "")],
+    ("MALTERIE-EXP", "BRASSERIE-REC->trace"): [("NumeroBL", "BonLivraison")],
+    ("MALTERIE-OF", "trace->"): [("C.PredecesseurCelluleOrigine", "CelluleDestination"),
+                                 ("C.Predecesseur", "")],
+    ("MALTERIE-OF", "->trace"): [("TypeFlux", "C.PredecesseurTypeFlux"),
+                                 ("NumeroFlux", "C.PredecesseurNumeroFlux"),
+                                 ("CelluleDestination", "C.PredecesseurCelluleOrigine")],
+    ("MALTERIE-REC", "MALTERIE-OF->trace"): [("TypeFlux", "C.PredecesseurTypeFlux"),
+                                             ("NumeroFlux", "C.PredecesseurNumeroFlux"),
+                                             ("CelluleDestination", "C.PredecesseurCelluleOrigine")],
+}
+
+# Colonnes dont le message indique une absence en aval avec "dont un"
+CARLSBERG_DOWNSTREAM_COLUMNS = ["BRASSERIE-OF->trace", "MALTERIE-OF->trace", "MALTERIE-EXP->trace"]
+
+CARLSBERG_PART_SEPARATOR = re.compile(r'\),\s*')
+CARLSBERG_LOT_VALUE_PATTERN = re.compile(r'(\(.*?\))')
+
+
+def compile_carlsberg_rules(col, rules=CARLSBERG_RULES):
+    """
+    Retourne, pour une colonne '->', les remplacements à appliquer par TraceType
+    """
+    compiled = {}
+    for (trace_type, arrow), replacements in rules.items():
+        if arrow in col:
+            compiled.setdefault(trace_type, []).extend(replacements)
+    return compiled
+
+
+def modify_error_type_carl(df, rules=CARLSBERG_RULES, copy=True):
     """
     Modifie les messages d'erreur pour les rendre plus explicites pour les missing relationship 
+    Avec copy=False, le DataFrame reçu est modifié sur place.
     """
     # Faire une copie du DataFrame pour éviter les avertissements "SettingWithCopyWarning"
-    df = df.copy()
-    def extract_word(text):
-        match = re.search(r'\b([A-Z]+(?:-[A-Z]+)*)\b', text)
-        if match:
-            return match.group(1)
-        else:
-            return ''
-        
-    # Fonction pour extraire la valeur du lot, qui suit immédiatement le nom du lot et se termine avant un espace ou une parenthèse
-    def extract_lot_value(value):
-        match = re.search(r'(\(.*?\))', value)
-        unique_tracetype = df['TraceType'].unique()[0]
-        if match: 
-            cleaned_value = match.group(1)
-            if unique_tracetype=="BRASSERIE-COND":
-                cleaned_value = cleaned_value.replace("NumeroLotProductionSource", "NumeroLotProduction")   
-            elif unique_tracetype=="BRASSERIE-OF":
-                if "trace->BRASSERIE-REC" in value : 
-                    cleaned_value = cleaned_value.replace("C.NumeroLotSource", "NumeroLotReception ")  
-                if "trace->BRASSERIE-OF" in value : 
-                    cleaned_value=cleaned_value.replace("C.NumeroLotSource","NumeroLotProduction")
-                if "BRASSERIE-COND->trace" in value : 
-                    cleaned_value=cleaned_value.replace("NumeroLotProduction","NumeroLotProductionSource ")
-                if "BRASSERIE-OF->trace" in value : 
-                    cleaned_value=cleaned_value.replace("NumeroLotProduction","C.NumeroLotSource")
-            elif unique_tracetype =="BRASSERIE-REC":
-                if "trace->MALTERIE-EXP" in value : 
-                    cleaned_value=cleaned_value.replace("BonLivraison","NumeroBL")
-                if "BRASSERIE-OF->trace" in value : 
-                    cleaned_value=cleaned_value.replace("NumeroLotReception","C.NumeroLotSource")
-            elif unique_tracetype=="MALTERIE-EXP" :
-                if "trace->MALTERIE-OF" in value:
-                    cleaned_value=cleaned_value.replace("C.PredecesseurCelluleOrigine","CelluleDestination")
-                    cleaned_value=cleaned_value.replace("C.Predecesseur","")
-                if "BRASSERIE-REC->trace" in value :
-                    cleaned_value=cleaned_value.replace("NumeroBL","BonLivraison")
-            elif unique_tracetype=="MALTERIE-OF":
-                if "trace->" in value :
-                    cleaned_value=cleaned_value.replace("C.PredecesseurCelluleOrigine","CelluleDestination")
-                    cleaned_value=cleaned_value.replace("C.Predecesseur","")
-                if "->trace" in value : 
-                    cleaned_value=cleaned_value.replace("TypeFlux","C.PredecesseurTypeFlux")
-                    cleaned_value=cleaned_value.replace("NumeroFlux","C.PredecesseurNumeroFlux")
-                    cleaned_value=cleaned_value.replace("CelluleDestination","C.PredecesseurCelluleOrigine")
-            elif unique_tracetype=="MALTERIE-REC":
-                if "MALTERIE-OF->trace" in value : 
-                    cleaned_value=cleaned_value.replace("TypeFlux","C.PredecesseurTypeFlux")
-                    cleaned_value=cleaned_value.replace("NumeroFlux","C.PredecesseurNumeroFlux")
-                    cleaned_value=cleaned_value.replace("CelluleDestination","C.PredecesseurCelluleOrigine")
-            return cleaned_value
-        else:
-            return None
-
+    if copy:
+        df = df.copy()
 
     # Identifier toutes les colonnes qui contiennent '->'
     arrow_columns = [col for col in df.columns if '->' in col]
-    col_names=["BRASSERIE-OF->trace","MALTERIE-OF->trace","MALTERIE-EXP->trace"]
-    # Fonction pour modifier le message d'erreur
-    def modify_message(row):
-        for col in arrow_columns:
-            if isinstance(row[col], str) and row[col].strip():  # Vérifier si la cellule a une valeur non vide
-                parts = re.split(r'\),\s*',row[col])
-                parts = [part + ')' if not part.endswith(')') and part else part for part in parts]
-                modified_parts = []
-                for part in parts:
-                    word = extract_word(col)
-                    lot_value = extract_lot_value(part)
-                    if col in col_names : 
-                        new_message = f"Absence {word} aval dont un {lot_value}"
-                    elif 'trace->' in col : 
-                        new_message = f"Absence {word} amont dont {lot_value}"
-                    else:
-                        new_message = f"Absence {word} aval dont {lot_value}"
-                    modified_parts.append(new_message)
-                # Recombiner les parties modifiées en une seule chaîne, séparées par des virgules
-                row[col] = ',\n'.join(modified_parts)
-        return row
-
-    df = df.apply(modify_message, axis=1)
-    
-    # Supprimer la colonne d'erreur d'origine
+    trace_types = df['TraceType'].to_numpy()
+
+    for col in arrow_columns:
+        positions = _non_empty_text_positions(df[col])
+        if len(positions) == 0:
+            continue
+        word = extract_word(col)
+        if col in CARLSBERG_DOWNSTREAM_COLUMNS:
+            prefix = f"Absence {word} aval dont un "
+        elif 'trace->' in col:
+            prefix = f"Absence {word} amont dont "
+        else:
+            prefix = f"Absence {word} aval dont "
+
+        # Découper chaque cellule en parties "X->Y (...)" en conservant la parenthèse fermante
+        values = df[col].to_numpy()
+        parts = pd.Series(values[positions], index=positions, dtype=object)
+        parts = parts.str.split(CARLSBERG_PART_SEPARATOR).explode()
+        parts = parts.where(parts.str.endswith(')') | parts.eq(''), parts + ')')
+
+        # Valeur du lot : la première parenthèse de chaque partie, traduite selon le TraceType de la ligne
+        lot_value = parts.str.extract(CARLSBERG_LOT_VALUE_PATTERN, expand=False)
+        part_trace_types = trace_types[lot_value.index.to_numpy()]
+        for trace_type, replacements in compile_carlsberg_rules(col, rules).items():
+            selected = (part_trace_types == trace_type) & lot_value.notna().to_numpy()
+            if not selected.any():
+                continue
+            translated = lot_value[selected]
+            for old, new in replacements:
+                translated = translated.str.replace(old, new, regex=False)
+            lot_value[selected] = translated.to_numpy()
+
+        # Recombiner les parties modifiées en une seule chaîne, séparées par des virgules
+        messages = prefix + lot_value.fillna('None')
+        rewritten = messages.groupby(level=0).agg(',\n'.join).reindex(positions)
+
+        new_values = values.astype(object)
+        new_values[positions] = rewritten.to_numpy()
+        df[col] = new_values
 
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,450 @@
+import hashlib
+import os
+import shutil
+import zipfile
+from io import BytesIO
+
+from copy import copy
+
+import numpy as np
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.comments import Comment
+
+from .jobs import SHARED_DIR
+from .pipeline import PipelineStats
+
+
+# Définition du mapping type/template
+TYPE_PRODUIT_TO_TEMPLATE = {
+    'TLC': 'NEW Template_Produits_AGEC_Crystalchain_v3.xlsx',
+    'ABJ': 'NEW Template_Produit_ABJ_Crystalchain.xlsx',
+    'EEE': 'NEW Template_Produit_EEE_CrystalchainMonoprix.xlsx',
+    'EMPAP': 'NEW Template_Produit_EMPAP_CrystalchainMonoprix.xlsx',
+    'EA': 'NEW Template_Produit_MEUBLE_CrystalchainMonoprix.xlsx',
+    'Jouet': 'NEW Template_Produit_JOUET_CrystalchainMonoprix.xlsx',
+    'ASL': 'NEW Template_Produit_ASL_Crystalchain.xlsx'
+}
+
+COLUMN_MAPPING = {
+    'entreprise': 'Entreprise',
+    'nom_du_produit': 'NomProduit',
+    'Pays_de_confection_ou_finition': 'PaysConfectionFinition',
+    'ref_produits': 'Reference Monoprix',
+    'node_name': 'Marque',
+    'Réference_modele_pour_fournisseur': 'ReferenceProduit',
+    'URL_photo': 'URLPhotoProduit',
+    'Présence_Substances_Dangereuses': 'SubstancesDangereuses',
+    'Emballage__recyclabilité': 'EmballageRecyclabilite',
+    'Emballage__présence_substances_dangereuses': 'EmballageSubstancesDangereuses',
+    'Collection': 'Collection',
+    'Description': 'Description',
+    'Informations_supplémentaires_fournisseur': 'InformationsSupplementaires',
+    'Commentaires': 'Commentaires',
+    "ean_uvc": "EAN"
+}
+
+# Colonne des données écrite dans la colonne "Reference Monoprix" des templates
+REFERENCE_COLUMN = 'ref_produits'
+
+# Répertoire contenant les templates (à adapter selon votre environnement)
+TEMPLATES_DIR = 'NEW Templates'
+
+# Utiliser un répertoire partagé pour stocker les fichiers générés
+# (sous-dossier dédié : le nettoyage ne doit pas toucher aux tâches d'upload dans /tmp/shared/jobs)
+MONOPRIX_DIR = os.path.join(SHARED_DIR, 'monoprix')
+MONOPRIX_ZIP_NAME = 'generated_templates.zip'
+
+# Première ligne de données des feuilles produit
+START_ROW = 8
+
+# Templates analysés par chemin, dans chaque processus worker : (date et taille du fichier, ParsedTemplate)
+_templates = {}
+
+# Tables de styles d'un classeur : les cellules copiées du template gardent leurs index de style
+_STYLE_TABLES = ['_fonts', '_fills', '_borders', '_alignments', '_protections', '_number_formats', '_cell_styles']
+# Autres attributs internes des classeurs et des feuilles copiés par ParsedTemplate.write
+_WORKBOOK_ATTRIBUTES = ['_named_styles', '_differential_styles', '_table_styles', '_colors', '_date_formats',
+                        '_timedelta_formats', 'loaded_theme', 'epoch', '_active_sheet_index']
+_SHEET_ATTRIBUTES = ['row_dimensions', 'column_dimensions', 'sheet_format', 'sheet_properties', 'views', 'protection',
+                     'data_validations', 'merged_cells', 'auto_filter', 'page_margins', 'page_setup', 'print_options',
+                     'HeaderFooter', 'row_breaks', 'col_breaks', 'conditional_formatting', 'sheet_state']
+
+
+def _write_only_copy_supported():
+    """
+    Vrai si la version installée d'openpyxl expose les attributs internes utilisés pour copier
+    un template en mode write-only (vérifié avec openpyxl 3.1, version de requirements.txt)
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    return (all(hasattr(wb, name) for name in _STYLE_TABLES + _WORKBOOK_ATTRIBUTES)
+            and all(hasattr(ws, name) for name in _SHEET_ATTRIBUTES)
+            and hasattr(Workbook().active, '_cells')
+            and all(hasattr(WriteOnlyCell(ws), name) for name in ('_value', '_style', 'has_style')))
+
+
+# Sinon, les classeurs sont écrits avec l'API publique d'openpyxl (plus lent, classeur complet en mémoire)
+WRITE_ONLY_COPY = _write_only_copy_supported()
+
+
+class ParsedTemplate:
+    """
+    Template produit analysé une seule fois : classeur préparé (en-tête mis en forme, listes déroulantes
+    de la feuille Format, colonne Type_de_produit, commentaires de la ligne 2), index des colonnes
+    de l'en-tête (nom -> numéro) et cellules non vides de chaque feuille, par ligne.
+    Les classeurs générés sont écrits en mode write-only à partir de ces éléments (voir write).
+    `valid` est faux si le template n'a pas de feuille produit ou de feuille Format.
+    """
+
+    def __init__(self, data, digest):
+        self.digest = digest
+        wb = load_workbook(BytesIO(data))
+        self.valid = len(wb.sheetnames) >= 2 and "Format" in wb.sheetnames
+        if not self.valid:
+            return
+        ws = wb.worksheets[1]
+        header = {}
+        for cell in ws[1]:
+            if cell.value is not None:
+                header.setdefault(cell.value, cell.column_letter)
+
+        # Listes déroulantes des champs 'enum' de la feuille Format
+        validations = []
+        format_ws = wb["Format"]
+        for row in format_ws.iter_rows(min_row=2, max_row=format_ws.max_row, min_col=1, max_col=18):
+            field_name = row[0].value
+            field_type = row[2].value
+            if field_type == 'enum':
+                dropdown_values = [cell.value for cell in row[5:18] if cell.value]
+                if dropdown_values and field_name in header:
+                    validations.append((header[field_name], ','.join(dropdown_values)))
+
+        self._prepare(ws, header, validations)
+        self.workbook = wb
+        self.columns = {}
+        for cell in ws[1]:
+            if cell.value is not None:
+                self.columns.setdefault(cell.value, cell.column)
+        self.template_rows = ws.max_row
+        if WRITE_ONLY_COPY:
+            self.rows = [_sheet_rows(sheet) for sheet in wb.worksheets]
+        else:
+            prepared = BytesIO()
+            wb.save(prepared)
+            self.prepared = prepared.getvalue()
+
+    @staticmethod
+    def _prepare(ws, header, validations):
+        """
+        Parties fixes de la feuille produit, communes à tous les classeurs générés
+        """
+        # Mettre en forme l'en-tête
+        for cell in ws[1]:
+            cell.font = Font(color="FFFFFF")
+        for col_letter, values_string in validations:
+            dv = DataValidation(
+                type="list",
+                formula1=f'"{values_string}"',
+                showDropDown=False
+            )
+            ws.add_data_validation(dv)
+            dv.add(f'{col_letter}{START_ROW}:{col_letter}1048576')
+
+        # Ajout de la colonne "Type_de_produit" si le template ne l'a pas
+        if 'Type_de_produit' not in header:
+            cell = ws.cell(row=1, column=ws.max_column + 1, value='Type_de_produit')
+            cell.font = Font(color="000000")
+
+        # Ajustement des commentaires
+        for cell in ws[2]:
+            cell.font = Font(color="FFFFFF")
+            if cell.comment:
+                comment_text = cell.comment.text
+                cell.comment = None
+                new_comment = Comment(comment_text, "Auteur")
+                cell.comment = new_comment
+                cell.comment.width = 400
+                cell.comment.height = 300
+
+    def write(self, path, columns, row_count, empty_rows=0):
+        """
+        Écrit un classeur généré en mode write-only d'openpyxl : les lignes sont envoyées au fichier au
+        fur et à mesure, sans garder les cellules en mémoire. Les feuilles du template préparé sont
+        copiées ; dans la feuille produit, `row_count` lignes de données à partir de START_ROW
+        (`columns` : numéro de colonne -> valeurs), puis `empty_rows` lignes du template sous les données.
+        """
+        if not WRITE_ONLY_COPY:
+            return self._write_public(path, columns, row_count, empty_rows)
+        wb = Workbook(write_only=True)
+        _copy_workbook_setup(self.workbook, wb)
+        product_ws = self.workbook.worksheets[1]
+
+        for source, source_rows in zip(self.workbook.worksheets, self.rows):
+            ws = wb.create_sheet(source.title)
+            _copy_sheet_setup(source, ws)
+            if source is not product_ws:
+                for cells in source_rows:
+                    ws.append(_copy_row(ws, cells))
+                last_row = len(source_rows)
+            else:
+                for cells in source_rows[:START_ROW - 1]:
+                    ws.append(_copy_row(ws, cells))
+
+                # Lignes de données construites à partir des colonnes, en un seul tableau
+                width = max(columns, default=0)
+                matrix = np.empty((row_count, width), dtype=object)
+                for column, values in columns.items():
+                    matrix[:, column - 1] = values
+                for position, row in enumerate(matrix.tolist()):
+                    cells = source_rows[START_ROW - 1 + position] if START_ROW - 1 + position < len(source_rows) else ()
+                    ws.append(_overlay_row(ws, row, cells, columns))
+
+                last_row = START_ROW - 1 + row_count + empty_rows
+                for cells in source_rows[START_ROW - 1 + row_count:last_row]:
+                    ws.append(_copy_row(ws, cells))
+            # Lignes vides qui n'ont qu'une hauteur ou un style de ligne
+            for _ in range(last_row, max(source.row_dimensions, default=0)):
+                ws.append([])
+        wb.save(path)
+
+    def _write_public(self, path, columns, row_count, empty_rows):
+        """
+        Même classeur que write, avec l'API publique d'openpyxl : le template préparé est rechargé
+        et rempli en mémoire
+        """
+        wb = load_workbook(BytesIO(self.prepared))
+        ws = wb.worksheets[1]
+        for column, values in columns.items():
+            for position, value in enumerate(values):
+                ws.cell(row=START_ROW + position, column=column).value = value
+        last_row = START_ROW - 1 + row_count + empty_rows
+        if ws.max_row > last_row:
+            ws.delete_rows(last_row + 1, ws.max_row - last_row)
+        wb.save(path)
+
+
+def _sheet_rows(ws):
+    """
+    Cellules non vides (valeur, style ou commentaire) d'une feuille, par ligne : [(colonne, cellule), ...]
+    """
+    rows = [[] for _ in range(ws.max_row)]
+    for (row, column), cell in sorted(ws._cells.items()):
+        if cell._value is not None or cell.has_style or cell.comment:
+            rows[row - 1].append((column, cell))
+    return rows
+
+
+def _copy_cell(ws, source):
+    cell = WriteOnlyCell(ws)
+    cell._value = source._value
+    cell.data_type = source.data_type
+    if source.has_style:
+        cell._style = copy(source._style)
+    if source.comment:
+        cell.comment = copy(source.comment)
+    return cell
+
+
+def _copy_row(ws, cells):
+    row = [None] * (cells[-1][0] if cells else 0)
+    for column, source in cells:
+        row[column - 1] = _copy_cell(ws, source)
+    return row
+
+
+def _overlay_row(ws, row, cells, columns):
+    """
+    Ligne de données posée sur une ligne du template : les cellules du template gardent leur style
+    et leur commentaire, leur valeur est remplacée dans les colonnes de données
+    """
+    for column, source in cells:
+        cell = _copy_cell(ws, source)
+        if column in columns:
+            cell.value = row[column - 1]
+        else:
+            row.extend([None] * (column - len(row)))
+        row[column - 1] = cell
+    return row
+
+
+def _copy_workbook_setup(source, wb):
+    """
+    Styles, thème et propriétés du classeur template (les tables de styles sont copiées :
+    les index de style des cellules restent valides)
+    """
+    for name in _STYLE_TABLES:
+        setattr(wb, name, IndexedList(getattr(source, name)))
+    wb._named_styles = source._named_styles
+    wb._differential_styles = source._differential_styles
+    wb._table_styles = source._table_styles
+    wb._colors = source._colors
+    wb._date_formats = dict(source._date_formats)
+    wb._timedelta_formats = dict(source._timedelta_formats)
+    wb.loaded_theme = source.loaded_theme
+    wb.epoch = source.epoch
+    wb.properties = copy(source.properties)
+    wb.calculation = copy(source.calculation)
+    wb.views = [copy(view) for view in source.views]
+    wb._active_sheet_index = source._active_sheet_index
+
+
+def _copy_sheet_setup(source, ws):
+    """
+    Paramètres d'une feuille du template (dimensions, affichage, protection, validations, impression),
+    à copier avant d'écrire la première ligne
+    """
+    for attr in ('row_dimensions', 'column_dimensions'):
+        target = getattr(ws, attr)
+        for key, dim in getattr(source, attr).items():
+            target[key] = copy(dim)
+            target[key].parent = ws
+    for attr in ('sheet_format', 'sheet_properties', 'views', 'protection', 'data_validations', 'merged_cells',
+                 'auto_filter', 'page_margins', 'page_setup', 'print_options', 'HeaderFooter', 'row_breaks',
+                 'col_breaks'):
+        setattr(ws, attr, copy(getattr(source, attr)))
+    ws.conditional_formatting = source.conditional_formatting
+    ws.sheet_state = source.sheet_state
+
+
+def get_template(path):
+    """
+    Template analysé depuis le cache du processus, analysé à nouveau si le fichier a changé
+    (date de modification ou taille, puis contenu)
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _templates.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if cached is not None and cached[1].digest == digest:
+        template = cached[1]
+    else:
+        template = ParsedTemplate(data, digest)
+    _templates[path] = (stamp, template)
+    return template
+
+
+def filter_products(df):
+    """
+    Produits ABSENT dont le Type_de_produit correspond à un template
+    """
+    if 'status' in df.columns:
+        df = df[df['status'] == 'ABSENT']
+    return df[df['Type_de_produit'].str.contains('|'.join(TYPE_PRODUIT_TO_TEMPLATE.keys()), case=False, na=False)]
+
+
+def reset_output_dir(shared_dir=MONOPRIX_DIR):
+    """
+    Vide le dossier des templates générés (sans le supprimer) et le crée au besoin
+    """
+    # Vérifier si le dossier existe
+    if os.path.exists(shared_dir):
+        # Supprimer uniquement les fichiers et sous-dossiers sans supprimer `shared_dir`
+        for filename in os.listdir(shared_dir):
+            file_path = os.path.join(shared_dir, filename)
+            try:
+                if os.path.isfile(file_path) or os.path.islink(file_path):
+                    os.unlink(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+            except Exception as e:
+                print(f"Erreur lors de la suppression de {file_path}: {e}")
+
+    # S'assurer que le dossier existe bien après le nettoyage
+    os.makedirs(shared_dir, exist_ok=True)
+
+
+def fill_supplier_templates(fournisseur, data, shared_dir=MONOPRIX_DIR, stats=None):
+    """
+    Génère dans le dossier du fournisseur un classeur par type de produit présent dans `data`
+    (lignes du fournisseur). Retourne les chemins des classeurs écrits.
+    """
+    stats = stats or PipelineStats(enabled=False, pipeline='generate_templates')
+    fournisseur_cleaned = fournisseur.replace("/", "-").replace("\\", "-")
+    fournisseur_dir = os.path.join(shared_dir, fournisseur_cleaned)
+    os.makedirs(fournisseur_dir, exist_ok=True)
+    paths = []
+
+    for type_produit, template_file_name in TYPE_PRODUIT_TO_TEMPLATE.items():
+        fournisseur_data = data[data['Type_de_produit'].str.contains(type_produit, case=False, na=False)]
+        if fournisseur_data.empty:
+            continue
+
+        # Durée et lignes de chaque template publiées sur /metrics
+        with stats.stage('fill_template', len(fournisseur_data)) as record:
+            template_file = os.path.join(TEMPLATES_DIR, template_file_name)
+            if not os.path.exists(template_file):
+                continue
+
+            template = get_template(template_file)
+            if not template.valid:
+                continue
+
+            # Suppression des doublons sur "Reference Monoprix" avant l'écriture : la première ligne
+            # de chaque référence est conservée, dans l'ordre des données
+            has_reference = 'Reference Monoprix' in template.columns
+            if has_reference:
+                fournisseur_data = fournisseur_data.drop_duplicates(subset=REFERENCE_COLUMN, keep='first')
+            row_count = len(fournisseur_data)
+            # Colonnes de données (numéro de colonne -> valeurs)
+            columns = {}
+            # Lignes contenant au moins une valeur (même règle que la valeur d'une cellule : None, '' et 0 sont vides)
+            row_has_data = np.zeros(row_count, dtype=bool)
+
+            # Remplissage des colonnes d'après le mapping
+            for input_col, template_col in COLUMN_MAPPING.items():
+                if template_col in template.columns:
+                    values = fournisseur_data[input_col].to_numpy(dtype=object)
+                    columns[template.columns[template_col]] = values
+                    row_has_data |= values.astype(bool)
+
+            # Remplissage des colonnes TraceNumber et TraceType
+            if 'TraceNumber' in template.columns and 'TraceType' in template.columns:
+                if type_produit == 'TLC':
+                    trace_type = 'PRODUIT-AGEC'
+                elif type_produit == "EA":
+                    trace_type = 'PRODUIT-Meuble'
+                else:
+                    trace_type = f'PRODUIT-{type_produit}'
+                columns[template.columns['TraceNumber']] = range(1, row_count + 1)
+                columns[template.columns['TraceType']] = [trace_type] * row_count
+                row_has_data[:] = True
+
+            # Gestion de la colonne "Deactivated"
+            if 'Deactivated' in template.columns:
+                columns[template.columns['Deactivated']] = np.where(row_has_data, 'false', None)
+
+            # Lignes du template sous les données. Avec "Reference Monoprix", elles ont une référence
+            # vide et sont supprimées comme doublons (la première est gardée si aucune référence écrite n'est vide)
+            empty_rows = max(0, template.template_rows - (START_ROW - 1 + row_count))
+            if has_reference:
+                empty_rows = min(empty_rows, int(not fournisseur_data[REFERENCE_COLUMN].isna().any()))
+
+            output_file = os.path.join(fournisseur_dir, f'{fournisseur_cleaned}_{type_produit}_CrystalChainMonoprix.xlsx')
+            template.write(output_file, columns, row_count, empty_rows)
+            paths.append(output_file)
+            record['output_rows'] = row_count + empty_rows
+    return paths
+
+
+def zip_templates(shared_dir=MONOPRIX_DIR):
+    """
+    Archive ZIP de tous les classeurs générés dans `shared_dir`. Retourne le chemin de l'archive.
+    """
+    zip_filename = os.path.join(shared_dir, MONOPRIX_ZIP_NAME)
+    with zipfile.ZipFile(zip_filename, 'w') as zf:
+        for root, dirs, files in os.walk(shared_dir):
+            for file in files:
+                if file != MONOPRIX_ZIP_NAME:
+                    file_path = os.path.join(root, file)
+                    arcname = os.path.relpath(file_path, shared_dir)
+                    zf.write(file_path, arcname)
+    return zip_filename
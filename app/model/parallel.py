@@ -0,0 +1,100 @@
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .logic import modify_error_type_carl
+
+
+# Exécution de la traduction Carlsberg : 'processes' (pool de processus), 'threads' ou 'sync'
+CARLSBERG_EXECUTOR = os.getenv('CARLSBERG_EXECUTOR', 'processes')
+# Nombre de workers (par défaut un par cœur)
+CARLSBERG_WORKERS = int(os.getenv('CARLSBERG_WORKERS', 0)) or os.cpu_count() or 1
+# Taille minimale d'une partition : en dessous, le coût d'envoi aux processus dépasse le gain
+CARLSBERG_MIN_PARTITION_ROWS = int(os.getenv('CARLSBERG_MIN_PARTITION_ROWS', 20000))
+# Nombre de partitions visé par worker, pour équilibrer la charge entre TraceTypes de tailles différentes
+PARTITIONS_PER_WORKER = 2
+# Méthode de démarrage des processus ('spawn' : sûr avec les threads du serveur web)
+CARLSBERG_START_METHOD = os.getenv('CARLSBERG_START_METHOD', 'spawn')
+
+_pools = {}
+
+
+def get_pool(executor, workers):
+    """
+    Pool ('processes' ou 'threads') réutilisé d'une requête à l'autre (le démarrage des
+    processus n'est payé qu'une fois)
+    """
+    key = (executor, workers)
+    if key not in _pools:
+        if executor == 'processes':
+            context = multiprocessing.get_context(CARLSBERG_START_METHOD)
+            _pools[key] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        else:
+            _pools[key] = ThreadPoolExecutor(max_workers=workers)
+    return _pools[key]
+
+
+@atexit.register
+def _shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def plan_partitions(trace_types, workers, min_rows=CARLSBERG_MIN_PARTITION_ROWS):
+    """
+    Découpe les positions des lignes en partitions d'un seul TraceType chacune.
+    La taille visée dépend du nombre de lignes et de workers (au moins `min_rows`).
+    Les partitions sont triées de la plus grande à la plus petite pour équilibrer les workers.
+    """
+    total = len(trace_types)
+    target = max(min_rows, -(-total // (workers * PARTITIONS_PER_WORKER)), 1)
+
+    codes, _ = pd.factorize(trace_types, use_na_sentinel=True)
+    order = np.argsort(codes, kind='stable')
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+
+    partitions = []
+    for positions in np.split(order, boundaries):
+        if len(positions):
+            partitions.extend(np.array_split(positions, -(-len(positions) // target)))
+    partitions.sort(key=len, reverse=True)
+    return partitions
+
+
+def _translate_partition(frame):
+    """
+    Traduit une partition (TraceType et colonnes '->' seulement) dans un worker
+    """
+    return modify_error_type_carl(frame, copy=False)
+
+
+def translate_carlsberg(df, executor=CARLSBERG_EXECUTOR, workers=CARLSBERG_WORKERS,
+                        min_rows=CARLSBERG_MIN_PARTITION_ROWS):
+    """
+    Applique modify_error_type_carl en parallèle, partition par partition, chaque partition
+    ne contenant qu'un TraceType. Seules les colonnes utiles sont envoyées aux workers ; les
+    colonnes traduites sont ensuite recopiées dans `df`, modifié sur place.
+    """
+    arrow_columns = [col for col in df.columns if '->' in col]
+    # Les processus fils du worker Celery (démons) ne peuvent pas créer de processus
+    if executor == 'processes' and multiprocessing.current_process().daemon:
+        executor = 'threads'
+    if executor == 'sync' or workers <= 1 or len(df) < 2 * min_rows or not arrow_columns:
+        return modify_error_type_carl(df, copy=False)
+
+    columns = ['TraceType'] + arrow_columns
+    partitions = plan_partitions(df['TraceType'].to_numpy(), workers, min_rows)
+    frames = (df[columns].take(positions).reset_index(drop=True) for positions in partitions)
+    results = get_pool(executor, workers).map(_translate_partition, frames)
+
+    translated = {col: df[col].to_numpy(dtype=object).copy() for col in arrow_columns}
+    for positions, result in zip(partitions, results):
+        for col in arrow_columns:
+            translated[col][positions] = result[col].to_numpy()
+    for col in arrow_columns:
+        df[col] = translated[col]
+    return df
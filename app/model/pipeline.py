@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+from ..metrics import observe_stage
+from .logic import (
+    rename_medor,
+    changer_errormessage,
+    classify_errors,
+    count_error_occurrences,
+    nettoyer_ligne_colonne,
+    split_error_families,
+    add_columns_and_remove,
+    sort_missing_relationships,
+    keep_first_occurrence_for_missing_relationship,
+    modify_error_type,
+)
+from .parallel import translate_carlsberg
+
+
+# Active la mesure mémoire de chaque étape (tracemalloc) : '1' pour l'activer.
+# tracemalloc mesure tout le processus : avec plusieurs requêtes simultanées (threads Flask ou
+# Celery), les valeurs d'une étape comprennent les allocations des autres requêtes.
+MEMORY_ACCOUNTING = os.getenv('PIPELINE_MEMORY_ACCOUNTING', '0') == '1'
+
+# Étapes mesurées en cours dans le processus : tracemalloc est démarré par la première et arrêté
+# par la dernière, et son pic n'est remis à zéro que si aucune autre étape n'est en cours
+_tracing_lock = threading.Lock()
+_tracing = {'stages': 0, 'owned': False}
+
+
+def _start_tracing():
+    """
+    Déclare une étape mesurée ; retourne True si elle est seule en cours (pic remis à zéro)
+    """
+    with _tracing_lock:
+        if _tracing['stages'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['owned'] = True
+        _tracing['stages'] += 1
+        alone = _tracing['stages'] == 1
+        if alone:
+            tracemalloc.reset_peak()
+        return alone
+
+
+def _stop_tracing():
+    """
+    Fin d'une étape mesurée : tracemalloc est arrêté après la dernière s'il a été démarré ici
+    """
+    with _tracing_lock:
+        _tracing['stages'] -= 1
+        if _tracing['stages'] == 0 and _tracing['owned']:
+            tracemalloc.stop()
+            _tracing['owned'] = False
+
+
+def count_rows(value):
+    """
+    Nombre de lignes d'un DataFrame ou d'une Series, ou total des DataFrames d'un tuple (None sinon)
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        rows = [len(item) for item in value if isinstance(item, pd.DataFrame)]
+        return sum(rows) if rows else None
+    return None
+
+
+class PipelineStats:
+    """
+    Mesure la durée et les lignes en entrée et en sortie de chaque étape d'un pipeline et, si
+    `enabled`, la mémoire allouée : `allocated_bytes` est le pic d'allocation pendant l'étape (None
+    si une autre étape était en cours dans le processus), `retained_bytes` ce qui reste alloué à la
+    fin de l'étape (valeur négative si l'étape a libéré de la mémoire).
+    `on_stage` est appelé avec le nom de chaque étape avant son exécution (progression des tâches).
+    Avec `pipeline`, chaque étape est aussi publiée dans les métriques Prometheus (app.metrics).
+    """
+
+    def __init__(self, enabled=MEMORY_ACCOUNTING, on_stage=None, pipeline=None):
+        self.enabled = enabled
+        self.on_stage = on_stage
+        self.pipeline = pipeline
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, input_rows=None):
+        """
+        Mesure un bloc de code comme une étape ; le bloc peut renseigner record['output_rows']
+        """
+        if self.on_stage is not None:
+            self.on_stage(name)
+        record = {'stage': name, 'input_rows': input_rows, 'output_rows': None}
+        if self.enabled:
+            alone = _start_tracing()
+            before, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - started
+            if self.enabled:
+                current, peak = tracemalloc.get_traced_memory()
+                # Pic non remis à zéro (autre étape en cours) : il peut précéder l'étape, pas de mesure
+                record['allocated_bytes'] = peak - before if alone else None
+                record['retained_bytes'] = current - before
+                _stop_tracing()
+            self.stages.append(record)
+            if self.pipeline is not None:
+                observe_stage(self.pipeline, record)
+
+    def run(self, name, func, *args, **kwargs):
+        """
+        Exécute une étape et enregistre ses mesures (lignes du premier argument et du résultat)
+        """
+        with self.stage(name, count_rows(args[0]) if args else None) as record:
+            result = func(*args, **kwargs)
+            record['output_rows'] = count_rows(result)
+            return result
+
+    def report(self):
+        """
+        Affiche la durée et la mémoire allouée par chaque étape
+        """
+        for stage in self.stages:
+            line = f"[pipeline] {stage['stage']}: {stage['seconds']:.2f} s"
+            if stage.get('allocated_bytes') is not None:
+                line += f", allouée {stage['allocated_bytes'] / 2**20:.1f} Mo"
+            if 'retained_bytes' in stage:
+                line += f", conservée {stage['retained_bytes'] / 2**20:.1f} Mo"
+            print(line)
+
+
+# Étapes de chaque pipeline dans l'ordre d'exécution, pour calculer la progression des tâches
+PIPELINE_STAGES = {
+    'medor': ['rename_medor', 'changer_errormessage', 'classify_errors', 'count_error_occurrences',
+              'nettoyer_ligne_colonne', 'split_error_families', 'add_columns_and_remove[logical]',
+              'add_columns_and_remove[perfect]', 'add_columns_and_remove[missing]',
+              'sort_missing_relationships', 'keep_first_occurrence_for_missing_relationship',
+              'modify_error_type'],
+    'carlsberg': ['changer_errormessage', 'nettoyer_ligne_colonne', 'classify_errors', 'split_error_families',
+                  'sort_missing_relationships', 'keep_first_occurrence_for_missing_relationship',
+                  'modify_error_type_carl'],
+}
+
+def classify_medor(df, stats=None):
+    """
+    Première partie du pipeline Medor : renommage, ErrorType, classification et comptages KPI.
+    Retourne (DataFrame classé, comptages KPI).
+    """
+    stats = stats or PipelineStats()
+
+    # Renommer les colonnes selon marghertira
+    df = stats.run('rename_medor', rename_medor, df)
+    # Modifier le champ _ErrorMessage en ErrorType
+    df = stats.run('changer_errormessage', changer_errormessage, df)
+    # Classer chaque ErrorType une seule fois (famille, KPIType et DataQualityType)
+    df = stats.run('classify_errors', classify_errors, df)
+    # Comptages du CSV de KPI
+    counts = stats.run('count_error_occurrences', count_error_occurrences, df)
+    return df, counts
+
+
+def format_medor(df, stats=None, seen_parent_ids=None, drop_empty_columns=True, status='on going'):
+    """
+    Seconde partie du pipeline Medor, sur un DataFrame classé par classify_medor : nettoyage,
+    statut, répartition par famille d'erreur, colonnes et traduction des messages.
+    Retourne (doublons logiques, doublons parfaits, missing relationship).
+    """
+    stats = stats or PipelineStats()
+
+    # Supprimer les lignes vides et colonnes vides
+    if drop_empty_columns:
+        df = stats.run('nettoyer_ligne_colonne', nettoyer_ligne_colonne, df)
+    else:
+        df = stats.run('nettoyer_ligne', pd.DataFrame.dropna, df, axis=0, how='all')
+
+    # Ajouter la colonne ErrorStatus
+    df['ErrorStatus'] = status
+
+    # Filtrer les données pour chaque type d'erreur
+    df_logic_duplicate, df_perfect_duplicate, df_missing_relationship = \
+        stats.run('split_error_families', split_error_families, df)
+    del df
+
+    # Ajouter les colonnes et supprimer les colonnes inutiles
+    df_logic_duplicate = stats.run('add_columns_and_remove[logical]', add_columns_and_remove, df_logic_duplicate, copy=False)
+    df_perfect_duplicate = stats.run('add_columns_and_remove[perfect]', add_columns_and_remove, df_perfect_duplicate, copy=False)
+    df_missing_relationship = stats.run('add_columns_and_remove[missing]', add_columns_and_remove, df_missing_relationship, copy=False)
+
+    # Classifier les types d'erreur dans une colonne spécifiée
+    df_missing_relationship = stats.run('sort_missing_relationships', sort_missing_relationships, df_missing_relationship)
+    # Garder la première occurrence pour les Missing relationship
+    df_missing_relationship = stats.run('keep_first_occurrence_for_missing_relationship',
+                                        keep_first_occurrence_for_missing_relationship,
+                                        df_missing_relationship, "ParentId", seen=seen_parent_ids, copy=False,
+                                        blank='mask')
+    # Traduction du message de log par quelque chose de plus intelligible par le client
+    df_missing_relationship = stats.run('modify_error_type', modify_error_type, df_missing_relationship, copy=False)
+
+    return df_logic_duplicate, df_perfect_duplicate, df_missing_relationship
+
+
+def run_medor_pipeline(df, stats=None, seen_parent_ids=None, drop_empty_columns=True):
+    """
+    Pipeline Medor sans copies défensives : le pipeline possède `df` et le modifie sur place.
+    Retourne (doublons logiques, doublons parfaits, missing relationship, comptages KPI).
+    Avec drop_empty_columns=False, seules les lignes vides sont supprimées (mode par blocs).
+    """
+    stats = stats or PipelineStats()
+    df, counts = classify_medor(df, stats)
+    return (*format_medor(df, stats, seen_parent_ids, drop_empty_columns), counts)
+
+
+def run_carlsberg_pipeline(df, stats=None):
+    """
+    Pipeline Carlsberg sans copies défensives : le pipeline possède `df` et le modifie sur place.
+    Retourne (doublons logiques, doublons parfaits, missing relationship).
+    """
+    stats = stats or PipelineStats()
+
+    # Modifier le champ _ErrorMessage en ErrorType
+    df = stats.run('changer_errormessage', changer_errormessage, df)
+    # Supprimer les lignes vides et colonnes vides
+    df = stats.run('nettoyer_ligne_colonne', nettoyer_ligne_colonne, df)
+    # Classer chaque ErrorType une seule fois (pas de DataQualityType pour Carlsberg)
+    df = stats.run('classify_errors', classify_errors, df)
+    df.drop(columns=['DataQualityType'], inplace=True)
+
+    # Filtrer les données pour chaque type d'erreur
+    df_logic_duplicate, df_perfect_duplicate, df_missing_relationship = \
+        stats.run('split_error_families', split_error_families, df)
+    del df
+
+    # Classifier les types d'erreur dans une colonne spécifiée
+    df_missing_relationship = stats.run('sort_missing_relationships', sort_missing_relationships, df_missing_relationship)
+    # Garder la première occurrence pour les Missing relationship
+    df_missing_relationship = stats.run('keep_first_occurrence_for_missing_relationship',
+                                        keep_first_occurrence_for_missing_relationship,
+                                        df_missing_relationship, "traceId", copy=False, blank='mask')
+    # Traduction du message de log, en parallèle par partitions d'un seul TraceType
+    df_missing_relationship = stats.run('modify_error_type_carl', translate_carlsberg, df_missing_relationship)
+    df_missing_relationship.drop(columns=['ErrorType'], inplace=True)
+
+    return df_logic_duplicate, df_perfect_duplicate, df_missing_relationship
@@ -0,0 +1,382 @@
+import polars as pl  # type: ignore
+import pandas as pd
+
+from .logic import (
+    MISSING_RELATIONSHIP_PATTERN,
+    LOT_NAME_PATTERNS,
+    LOT_VALUE_PATTERNS,
+    CARLSBERG_RULES,
+    CARLSBERG_DOWNSTREAM_COLUMNS,
+    CARLSBERG_LOT_VALUE_PATTERN,
+    ERROR_FAMILY_PREFIXES,
+    DATA_QUALITY_RULES,
+    CLASSIFICATION_COLUMNS,
+    LOGICAL_DUPLICATE,
+    PERFECT_DUPLICATE,
+    MISSING_RELATIONSHIP,
+    OTHER_ERROR,
+    MEDOR_UNUSED_COLUMNS,
+    KPI_TYPES,
+    DATA_QUALITY_TYPES,
+    REPEAT_MASK_COLUMN,
+    compile_carlsberg_rules,
+    extract_word,
+)
+from .ingest import INGEST_SCHEMAS, TRUE_VALUES, FALSE_VALUES
+
+
+# Séparateur interne utilisé pour découper les messages Carlsberg sur "),"
+PART_SEPARATOR = '\x1f'
+
+MEDOR_RENAMES = {'TraceType': 'ParentType', 'TraceNumber': 'ParentNumber', 'traceId': 'ParentId'}
+
+# Colonnes catégorielles du moteur pandas (classify_errors) et leurs catégories
+CATEGORICAL_COLUMNS = {'KPIType': KPI_TYPES, 'DataQualityType': DATA_QUALITY_TYPES}
+
+
+def scan_export(path):
+    """
+    Prépare la lecture paresseuse d'un export CSV (toutes les colonnes en texte, typées par
+    apply_export_types une fois l'export lu)
+    """
+    return pl.scan_csv(path, separator=';', infer_schema_length=0)
+
+
+def infer_export_types(df, text_columns):
+    """
+    Types des colonnes de l'export tels que les infère read_export (moteur pandas) sur le fichier
+    entier : booléens, entiers (décimaux s'il manque des valeurs), décimaux, sinon texte.
+    Les colonnes déclarées texte dans INGEST_SCHEMAS restent du texte.
+    """
+    types = {}
+    for column, dtype in zip(df.columns, df.dtypes):
+        if column in text_columns or dtype != pl.Utf8:
+            continue
+        values = df[column].drop_nulls()
+        if len(values) == 0:
+            continue
+        if values.is_in(TRUE_VALUES + FALSE_VALUES).all():
+            types[column] = pl.Boolean
+            continue
+        for number_type in (pl.Int64, pl.UInt64, pl.Float64):
+            if values.cast(number_type, strict=False).null_count() == 0:
+                has_nulls = len(values) < df.height
+                types[column] = pl.Float64 if has_nulls else number_type
+                break
+    return types
+
+
+def apply_export_types(df, text_columns):
+    """
+    Convertit les colonnes de l'export (lues en texte) en booléens et en nombres (infer_export_types)
+    """
+    columns = []
+    for column, dtype in infer_export_types(df, text_columns).items():
+        if dtype == pl.Boolean:
+            columns.append(pl.when(pl.col(column).is_null()).then(pl.lit(None))
+                           .otherwise(pl.col(column).is_in(TRUE_VALUES)).alias(column))
+        else:
+            columns.append(pl.col(column).cast(dtype))
+    return df.with_columns(columns) if columns else df
+
+
+def _date_expr(column):
+    """
+    Date (AAAA-MM-JJ) d'une colonne horodatée ISO, quel que soit le fuseau indiqué
+    """
+    return pl.col(column).str.slice(0, 10).str.strptime(pl.Date, '%Y-%m-%d', strict=False)
+
+
+def rename_medor_pl(lf):
+    return lf.rename({old: new for old, new in MEDOR_RENAMES.items() if old in lf.columns})
+
+
+def changer_errormessage_pl(lf):
+    """
+    Modifie les messages d'erreur pour les rendre plus explicites
+    """
+    error_type = (pl.col('_ErrorMessage')
+                  .str.replace_all('Duplicate with', 'Perfect Duplicate with', literal=True)
+                  .str.replace_all(r'Duplicate value of field .*?(TR_)', 'Logical Duplicate with ${1}'))
+    return lf.with_columns(error_type.alias('ErrorType')).drop('_ErrorMessage')
+
+
+def nettoyer_lignes_pl(lf):
+    """
+    Suppression des lignes vides
+    """
+    has_value = pl.fold(pl.lit(False), lambda acc, value: acc | value,
+                        [pl.col(column).is_not_null() for column in lf.columns])
+    return lf.filter(has_value)
+
+
+def drop_empty_columns(df):
+    """
+    Suppression des colonnes vides
+    """
+    return df.drop([column for column in df.columns if df[column].null_count() == df.height])
+
+
+def classify_errors_pl(lf, data_quality=True):
+    """
+    Ajoute les colonnes ErrorFamily, KPIType et DataQualityType (mêmes règles que classify_errors)
+    """
+    error_type = pl.col('ErrorType')
+
+    family = pl.lit(OTHER_ERROR)
+    for prefix, prefix_family in reversed(ERROR_FAMILY_PREFIXES):
+        family = pl.when(error_type.str.starts_with(prefix)).then(pl.lit(prefix_family)).otherwise(family)
+
+    kpi_type = (pl.when(error_type.is_null()).then(pl.lit(None))
+                .when(error_type.str.contains('Missing', literal=True)).then(pl.lit('Missing Relationship'))
+                .otherwise(pl.lit('Duplicate')))
+
+    columns = [family.alias('ErrorFamily'), kpi_type.alias('KPIType')]
+    if data_quality:
+        quality_type = pl.lit('not defined')
+        for pattern, pattern_type in reversed(DATA_QUALITY_RULES):
+            quality_type = (pl.when(error_type.str.contains(pattern, literal=True))
+                            .then(pl.lit(pattern_type)).otherwise(quality_type))
+        columns.append(quality_type.alias('DataQualityType'))
+    return lf.with_columns(columns)
+
+
+def select_family_pl(lf, family):
+    return lf.filter(pl.col('ErrorFamily') == family).drop(CLASSIFICATION_COLUMNS)
+
+
+def count_errors_by_type_and_manufacturer_pl(lf):
+    """
+    Compte les erreurs par ParentType, Manufacturer, date et type KPI (KPI-MONITORING)
+    """
+    keys = ['ParentType', 'Manufacturer', 'Date', 'KPIType']
+    return (lf.with_columns(_date_expr('createdAt').alias('Date'))
+            .drop_nulls(keys)
+            .groupby(keys)
+            .agg(pl.count().cast(pl.Int64).alias('Count'))
+            .sort(keys)
+            .with_row_count('TraceNumber', offset=1)
+            .select([pl.lit('KPI-MONITORING').alias('TraceType'), pl.col('TraceNumber').cast(pl.Int64)]
+                    + keys + ['Count', pl.lit('False').alias('Deactivated')]))
+
+
+def add_columns_and_remove_pl(lf):
+    """
+    Ajoute TraceType, TraceNumber et TimeSinceError et supprime les colonnes inutiles
+    """
+    columns = lf.columns
+    if 'ParentType' in columns and 'ParentNumber' in columns:
+        lf = lf.select([(pl.lit('DATA-QUALITY-') + pl.col('ParentType')).alias('TraceType'),
+                        pl.col('ParentNumber').alias('TraceNumber'),
+                        pl.all()])
+    lf = lf.with_columns(_date_expr('createdAt').dt.strftime('%Y / %m / %d').alias('TimeSinceError'))
+    return lf.drop([column for column in MEDOR_UNUSED_COLUMNS + ['createdAt'] if column in lf.columns])
+
+
+def missing_relationship_types(df):
+    """
+    Types "X->Y" présents dans les ErrorType, dans l'ordre de première apparition
+    """
+    labels = df.select(pl.col('ErrorType').str.extract_all(MISSING_RELATIONSHIP_PATTERN.pattern)
+                       .alias('label')).explode('label')
+    types = labels.select(pl.col('label').str.extract(r'^(\S+) \(', 1).drop_nulls().unique(maintain_order=True))
+    return types['label'].to_list()
+
+
+def sort_missing_relationships_pl(lf, error_types):
+    """
+    Crée une colonne par type "X->Y" contenant ses occurrences séparées par ',\n'
+    """
+    labels = pl.col('ErrorType').str.extract_all(MISSING_RELATIONSHIP_PATTERN.pattern)
+    return lf.with_columns([
+        labels.arr.eval(pl.element().filter(pl.element().str.starts_with(f'{error_type} (')))
+        .arr.join(',\n').fill_null('').alias(error_type)
+        for error_type in error_types
+    ])
+
+
+def blanked_columns(columns):
+    """
+    Champs vidés sur les occurrences répétées (mêmes colonnes que first_occurrence_kept_columns)
+    """
+    return [column for column in columns
+            if not (column.startswith('C.') or '->' in column
+                    or column in ('ParentType', 'TraceNumber', 'TraceType', 'ErrorType', REPEAT_MASK_COLUMN))]
+
+
+def keep_first_occurrence_pl(lf, col_name):
+    """
+    Marque dans REPEAT_MASK_COLUMN toutes les occurrences de col_name sauf la première, comme
+    keep_first_occurrence_for_missing_relationship(blank='mask') : les champs hors composition
+    de ces lignes sont vidés à l'écriture
+    """
+    return lf.with_columns((~pl.col(col_name).is_first()).alias(REPEAT_MASK_COLUMN))
+
+
+def _non_empty_text(column):
+    return pl.col(column).str.strip().str.lengths() > 0
+
+
+# Colonnes de travail de _rewrite_parts
+ROW_COLUMN = '__row'
+PART_COLUMN = '__part'
+
+
+def _rewrite_parts(lf, column, parts, message):
+    """
+    Réécrit les cellules non vides de `column` : `parts` découpe la cellule en liste de parties et
+    `message` réécrit chaque partie (pl.col(PART_COLUMN)).
+    Les parties sont dépliées sur une seule colonne puis regroupées par ligne : les expressions
+    régulières s'appliquent à toute la colonne en une fois, et non liste par liste comme avec arr.eval.
+    """
+    messages = (lf.filter(_non_empty_text(column))
+                .select([pl.col(ROW_COLUMN), parts.alias(PART_COLUMN)])
+                .explode(PART_COLUMN)
+                .select([pl.col(ROW_COLUMN), message.alias(PART_COLUMN)])
+                .groupby(ROW_COLUMN, maintain_order=True)
+                .agg(pl.col(PART_COLUMN).drop_nulls().str.concat(',\n')))
+    return (lf.join(messages, on=ROW_COLUMN, how='left')
+            .with_columns(pl.coalesce([pl.col(PART_COLUMN), pl.col(column)]).alias(column))
+            .drop(PART_COLUMN))
+
+
+def modify_error_type_pl(lf, arrow_columns):
+    """
+    Réécrit les colonnes '->' en messages "<lot> <valeur> not found in <MOT>"
+    """
+    part = pl.col(PART_COLUMN)
+    lot_name = part.str.extract(LOT_NAME_PATTERNS[0].pattern, 1)
+    for pattern in LOT_NAME_PATTERNS[1:]:
+        lot_name = lot_name.fill_null(part.str.extract(pattern.pattern, 1))
+    lot_value = part.str.extract(LOT_VALUE_PATTERNS[0].pattern, 1)
+    for pattern in LOT_VALUE_PATTERNS[1:]:
+        lot_value = lot_value.fill_null(part.str.extract(pattern.pattern, 1))
+
+    lf = lf.with_row_count(ROW_COLUMN)
+    for column in arrow_columns:
+        message = pl.concat_str([lot_name, pl.lit(' '), lot_value.fill_null(''),
+                                 pl.lit(f' not found in {extract_word(column)}')])
+        lf = _rewrite_parts(lf, column, pl.col(column).str.split(','), message)
+    return lf.drop([ROW_COLUMN, 'ErrorType'])
+
+
+def modify_error_type_carl_pl(lf, arrow_columns, rules=CARLSBERG_RULES):
+    """
+    Réécrit les colonnes '->' en messages "Absence <MOT> amont/aval dont (...)" selon CARLSBERG_RULES
+    """
+    rewritten = []
+    for column in arrow_columns:
+        word = extract_word(column)
+        if column in CARLSBERG_DOWNSTREAM_COLUMNS:
+            prefix = f"Absence {word} aval dont un "
+        elif 'trace->' in column:
+            prefix = f"Absence {word} amont dont "
+        else:
+            prefix = f"Absence {word} aval dont "
+
+        parts = (pl.col(column).str.replace_all(r'\),\s*', ')' + PART_SEPARATOR)
+                 .str.split(PART_SEPARATOR)
+                 .arr.eval(pl.when(pl.element().str.ends_with(')') | (pl.element().str.lengths() == 0))
+                           .then(pl.element()).otherwise(pl.element() + ')')))
+
+        def rewrite(replacements):
+            lot_value = pl.element().str.extract(CARLSBERG_LOT_VALUE_PATTERN.pattern, 1)
+            for old, new in replacements:
+                lot_value = lot_value.str.replace_all(old, new, literal=True)
+            return parts.arr.eval(pl.lit(prefix) + lot_value.fill_null('None')).arr.join(',\n')
+
+        # Les remplacements dépendent du TraceType de chaque ligne
+        new_value = rewrite([])
+        for trace_type, replacements in compile_carlsberg_rules(column, rules).items():
+            new_value = pl.when(pl.col('TraceType') == trace_type).then(rewrite(replacements)).otherwise(new_value)
+
+        rewritten.append(pl.when(_non_empty_text(column)).then(new_value)
+                         .otherwise(pl.col(column)).alias(column))
+    return lf.with_columns(rewritten)
+
+
+def run_medor_pipeline_pl(path):
+    """
+    Pipeline Medor en Polars. Retourne (doublons logiques, doublons parfaits,
+    missing relationship, KPI) sous forme de DataFrames Polars.
+    """
+    lf = rename_medor_pl(scan_export(path))
+    # Projection : les colonnes supprimées plus tard ne sont jamais lues
+    lf = lf.drop([column for column in MEDOR_UNUSED_COLUMNS if column in lf.columns])
+    lf = classify_errors_pl(changer_errormessage_pl(nettoyer_lignes_pl(lf)))
+
+    df = drop_empty_columns(lf.collect())
+    df = apply_export_types(df, [MEDOR_RENAMES.get(column, column) for column in INGEST_SCHEMAS['medor']['dtypes']])
+    df = df.with_columns(pl.lit('on going').alias('ErrorStatus'))
+
+    logic_duplicate = add_columns_and_remove_pl(select_family_pl(df.lazy(), LOGICAL_DUPLICATE))
+    perfect_duplicate = add_columns_and_remove_pl(select_family_pl(df.lazy(), PERFECT_DUPLICATE))
+    missing = add_columns_and_remove_pl(select_family_pl(df.lazy(), MISSING_RELATIONSHIP))
+    error_types = missing_relationship_types(df.filter(pl.col('ErrorFamily') == MISSING_RELATIONSHIP))
+    missing = sort_missing_relationships_pl(missing, error_types)
+    missing = keep_first_occurrence_pl(missing, "ParentId")
+    missing = modify_error_type_pl(missing, error_types)
+    kpi = count_errors_by_type_and_manufacturer_pl(df.lazy())
+
+    return tuple(pl.collect_all([logic_duplicate, perfect_duplicate, missing, kpi]))
+
+
+def run_carlsberg_pipeline_pl(path):
+    """
+    Pipeline Carlsberg en Polars. Retourne (doublons logiques, doublons parfaits,
+    missing relationship) sous forme de DataFrames Polars.
+    """
+    lf = changer_errormessage_pl(nettoyer_lignes_pl(scan_export(path)))
+
+    df = drop_empty_columns(lf.collect())
+    df = apply_export_types(df, list(INGEST_SCHEMAS['carlsberg']['dtypes']))
+    df = classify_errors_pl(df.lazy(), data_quality=False).collect()
+
+    logic_duplicate = select_family_pl(df.lazy(), LOGICAL_DUPLICATE)
+    perfect_duplicate = select_family_pl(df.lazy(), PERFECT_DUPLICATE)
+    error_types = missing_relationship_types(df.filter(pl.col('ErrorFamily') == MISSING_RELATIONSHIP))
+    missing = sort_missing_relationships_pl(select_family_pl(df.lazy(), MISSING_RELATIONSHIP), error_types)
+    missing = keep_first_occurrence_pl(missing, "traceId")
+    missing = modify_error_type_carl_pl(missing, error_types).drop('ErrorType')
+
+    return tuple(pl.collect_all([logic_duplicate, perfect_duplicate, missing]))
+
+
+def to_csv_text(df):
+    """
+    Sérialise en CSV ';' comme pandas : champs des occurrences répétées vidés, chaînes vides écrites
+    sans guillemets, booléens en True/False et décimaux dans le format de Python (repr)
+    """
+    if REPEAT_MASK_COLUMN in df.columns:
+        repeated = pl.col(REPEAT_MASK_COLUMN)
+        df = df.with_columns([pl.when(repeated).then(pl.lit(None)).otherwise(pl.col(column)).alias(column)
+                              for column in blanked_columns(df.columns)]).drop(REPEAT_MASK_COLUMN)
+    columns = []
+    for column, dtype in zip(df.columns, df.dtypes):
+        if dtype == pl.Utf8:
+            columns.append(pl.when(pl.col(column) == '').then(pl.lit(None)).otherwise(pl.col(column)).alias(column))
+        elif dtype == pl.Boolean:
+            columns.append(pl.when(pl.col(column)).then(pl.lit('True'))
+                           .when(pl.col(column).is_not_null()).then(pl.lit('False')).alias(column))
+        elif dtype in (pl.Float32, pl.Float64):
+            columns.append(pl.col(column).apply(repr, return_dtype=pl.Utf8).alias(column))
+    return df.with_columns(columns).write_csv(separator=';')
+
+
+def to_pandas(df):
+    """
+    Convertit un DataFrame Polars en DataFrame pandas (sans dépendre de pyarrow) avec les types du
+    moteur pandas : entiers avec des cellules vides en Int64, dates en objets date, colonnes catégorielles
+    """
+    columns = {}
+    for column, dtype in zip(df.columns, df.dtypes):
+        values = df[column]
+        if dtype in (pl.Int64, pl.UInt64) and values.null_count():
+            columns[column] = pd.array(values.to_list(), dtype='Int64' if dtype == pl.Int64 else 'UInt64')
+        elif dtype == pl.Date:
+            columns[column] = pd.Series(values.to_list(), dtype=object)
+        elif column in CATEGORICAL_COLUMNS:
+            columns[column] = pd.Categorical(values.to_numpy(), categories=CATEGORICAL_COLUMNS[column])
+        else:
+            columns[column] = values.to_numpy()
+    return pd.DataFrame(columns, columns=df.columns)
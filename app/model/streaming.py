@@ -0,0 +1,186 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from .archive import write_zip_file, file_entry
+from .excel_writer import IncrementalExcelWriter
+from .ingest import ingest_columns, INGEST_SCHEMAS, FLOAT_PRECISION
+from .logic import (
+    rename_medor,
+    combine_error_counts,
+    format_error_counts,
+    KPI_GROUP_COLUMNS,
+    REPEAT_MASK_COLUMN,
+    render_blanked_cells,
+)
+from .pipeline import PipelineStats, run_medor_pipeline
+
+
+# Nombre de lignes lues par bloc en mode streaming
+MEDOR_CHUNKSIZE = int(os.getenv('MEDOR_CHUNKSIZE', 100000))
+
+# Rapports produits par le pipeline Medor : (préfixe du fichier CSV, onglet Excel)
+MEDOR_REPORTS = [
+    ('Logic_duplicate', 'Logical_Duplicate sheet'),
+    ('Perfect_duplicate', 'Perfect_Duplicate sheet'),
+    ('Missing_relationship', 'Missing_relationship sheet'),
+]
+
+
+def process_medor_chunk(chunk, seen_parent_ids, stats=None):
+    """
+    Applique le pipeline Medor à un bloc de lignes (étapes mesurées par `stats`).
+    Retourne les trois rapports du bloc et les comptages KPI du bloc.
+    """
+    # Les colonnes vides ne sont connues qu'à la fin du fichier : seules les lignes vides sont retirées ici
+    # Les ParentId déjà vus dans les blocs précédents ne sont plus des premières occurrences
+    *reports, counts = run_medor_pipeline(chunk, stats, seen_parent_ids=seen_parent_ids,
+                                         drop_empty_columns=False)
+    return reports, counts
+
+
+def _chunk_column_kind(values):
+    """
+    Type inféré par le moteur C de pandas pour une colonne d'un bloc : 'bool', dtype numérique,
+    'text', ou None si la colonne est vide dans ce bloc
+    """
+    if not values.notna().any():
+        return None
+    if values.dtype == bool:
+        return 'bool'
+    if values.dtype.kind in 'iuf':
+        return values.dtype
+    # Booléens avec des valeurs manquantes : colonne object de True/False
+    if values.dropna().map(type).eq(bool).all():
+        return 'bool'
+    return 'text'
+
+
+def infer_file_dtypes(source, usecols, text_columns, chunksize=MEDOR_CHUNKSIZE):
+    """
+    Types des colonnes du fichier entier, tels que les infère la lecture en une fois du mode classique
+    (read_export) : premier passage par blocs et combinaison des types de chaque bloc.
+    Retourne les types des colonnes booléennes et numériques ; les autres colonnes sont du texte.
+    """
+    position = source.tell()
+    kinds = {}
+    has_nans = set()
+    reader = pd.read_csv(source, sep=";", dtype=text_columns, usecols=usecols, chunksize=chunksize,
+                         float_precision=FLOAT_PRECISION)
+    for chunk in reader:
+        for column in chunk.columns:
+            if column in text_columns:
+                continue
+            values = chunk[column]
+            if values.hasnans:
+                has_nans.add(column)
+            kind = _chunk_column_kind(values)
+            kinds.setdefault(column, set())
+            if kind is not None:
+                kinds[column].add(kind)
+    source.seek(position)
+
+    dtypes = {}
+    for column, column_kinds in kinds.items():
+        if not column_kinds:
+            # Colonne entièrement vide : NaN (float)
+            dtypes[column] = np.dtype(float)
+        elif column_kinds == {'bool'}:
+            # Booléens avec valeurs manquantes : True/False/NaN en object, comme la lecture en une fois
+            dtypes[column] = np.dtype(object) if column in has_nans else np.dtype(bool)
+        elif 'bool' not in column_kinds and 'text' not in column_kinds:
+            dtype = np.result_type(*column_kinds)
+            dtypes[column] = np.dtype(float) if dtype.kind in 'iu' and column in has_nans else dtype
+    return dtypes
+
+
+def _ordered_union(column_lists):
+    """
+    Union des colonnes de plusieurs blocs, dans l'ordre de première apparition
+    """
+    columns = []
+    known = set()
+    for column_list in column_lists:
+        for column in column_list:
+            if column not in known:
+                known.add(column)
+                columns.append(column)
+    return columns
+
+
+def process_medor_in_chunks(source, work_dir, file_name, today, chunksize=MEDOR_CHUNKSIZE):
+    """
+    Traite un export Medor par blocs de `chunksize` lignes et écrit les rapports sur disque.
+    Les résultats de chaque bloc sont mis en attente sur disque puis assemblés dans les CSV
+    et le fichier Excel : la mémoire utilisée ne dépend pas de la taille du fichier.
+    Retourne le chemin de l'archive ZIP produite.
+    """
+    spool_dir = os.path.join(work_dir, 'spool')
+    os.makedirs(spool_dir, exist_ok=True)
+
+    spooled = {prefix: [] for prefix, _ in MEDOR_REPORTS}
+    seen_parent_ids = set()
+    counts = None
+    raw_columns = []
+    non_empty_columns = set()
+    # Les étapes sont mesurées bloc par bloc
+    stats = PipelineStats(enabled=False, pipeline='medor_stream')
+
+    # Les colonnes obligatoires sont vérifiées et les colonnes supprimées par le pipeline ne sont pas lues
+    source = getattr(source, 'stream', source)
+    usecols = ingest_columns(source, 'medor')
+    # Chaque bloc reçoit les types inférés sur le fichier entier (premier passage) : les rapports
+    # ont les mêmes valeurs qu'en mode classique, quel que soit le découpage en blocs
+    text_columns = {column: str for column in INGEST_SCHEMAS['medor']['dtypes'] if column in usecols}
+    dtypes = infer_file_dtypes(source, usecols, text_columns, chunksize)
+    text_columns.update({column: str for column in usecols if column not in text_columns and column not in dtypes})
+    reader = pd.read_csv(source, sep=";", dtype=text_columns, usecols=usecols, chunksize=chunksize,
+                         float_precision=FLOAT_PRECISION)
+    for number, chunk in enumerate(reader):
+        chunk = chunk.astype(dtypes)
+        columns = rename_medor(chunk.head(0).copy()).columns
+        if not raw_columns:
+            raw_columns = columns.tolist()
+        non_empty_columns.update(columns[chunk.notna().any().to_numpy()])
+
+        reports, chunk_counts = process_medor_chunk(chunk, seen_parent_ids, stats)
+        counts = chunk_counts if counts is None else combine_error_counts([counts, chunk_counts])
+
+        for (prefix, _), report in zip(MEDOR_REPORTS, reports):
+            path = os.path.join(spool_dir, f'{prefix}_{number}.pkl')
+            report.to_pickle(path)
+            spooled[prefix].append((path, report.columns.drop(REPEAT_MASK_COLUMN, errors='ignore').tolist()))
+
+    # Colonnes vides sur l'ensemble du fichier (supprimées par nettoyer_ligne_colonne en mode classique)
+    empty_columns = set(raw_columns) - non_empty_columns
+
+    zip_path = os.path.join(work_dir, f'filtered_data_{file_name}.zip')
+    excel_path = os.path.join(work_dir, f'ALL_Errors_report_{file_name}_{today}.xlsx')
+    csv_paths = []
+
+    with IncrementalExcelWriter(excel_path) as excel_writer:
+        for prefix, sheet_name in MEDOR_REPORTS:
+            columns = [column for column in _ordered_union(cols for _, cols in spooled[prefix])
+                       if column not in empty_columns]
+            excel_writer.add_sheet(sheet_name, columns)
+
+            csv_path = os.path.join(work_dir, f'{prefix}_{file_name}_{today}.csv')
+            with open(csv_path, 'w', encoding='utf-8', newline='') as csv_file:
+                pd.DataFrame(columns=columns).to_csv(csv_file, index=False, sep=";")
+                for path, _ in spooled[prefix]:
+                    # Les champs des occurrences suivantes ne sont vidés qu'au moment de l'écriture
+                    report = render_blanked_cells(pd.read_pickle(path)).reindex(columns=columns)
+                    report.to_csv(csv_file, index=False, header=False, sep=";")
+                    excel_writer.append(sheet_name, report)
+                    os.remove(path)
+            csv_paths.append(csv_path)
+
+    kpi_path = os.path.join(work_dir, f'KPI_{file_name}_{today}.csv')
+    if counts is None:
+        counts = pd.Series([], dtype=int, index=pd.MultiIndex.from_tuples([], names=KPI_GROUP_COLUMNS))
+    format_error_counts(counts).to_csv(kpi_path, index=False, encoding="utf-8", sep=";")
+
+    write_zip_file(zip_path, [(os.path.basename(path), file_entry(path)) for path in csv_paths + [excel_path, kpi_path]])
+
+    return zip_path
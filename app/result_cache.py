@@ -0,0 +1,144 @@
+# app/result_cache.py
+import glob
+import hashlib
+import os
+import threading
+import time
+
+from flask_caching import Cache
+
+
+# Cache des archives ZIP déjà produites (Redis, base 1 : la base 0 sert aux résultats Celery)
+# RESULT_CACHE_TYPE=NullCache désactive le cache
+CACHE_CONFIG = {
+    'CACHE_TYPE': os.getenv('RESULT_CACHE_TYPE', 'RedisCache'),
+    'CACHE_REDIS_URL': os.getenv('RESULT_CACHE_REDIS_URL', 'redis://redis:6379/1'),
+    'CACHE_DEFAULT_TIMEOUT': int(os.getenv('RESULT_CACHE_TTL', 6 * 3600)),
+    'CACHE_KEY_PREFIX': 'data_filter_result:',
+}
+# Taille maximale d'une archive mise en cache et taille totale du cache (octets)
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv('RESULT_CACHE_MAX_ENTRY_BYTES', 50 * 2**20))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 500 * 2**20))
+
+# Clé de l'index des archives en cache : {clé: [taille, date d'écriture]}, pour l'éviction par taille
+INDEX_KEY = 'index'
+# Durée maximale de détention et d'attente du verrou de l'index (secondes)
+INDEX_LOCK_TIMEOUT = 30
+
+# Verrou de l'index quand le cache n'est pas partagé par Redis (SimpleCache, NullCache)
+_local_index_lock = threading.Lock()
+
+cache = Cache()
+
+
+def _pipeline_version():
+    """
+    Empreinte du code des pipelines : un déploiement qui modifie app/model invalide le cache
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'model', '*.py'))):
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:12]
+
+
+PIPELINE_VERSION = os.getenv('PIPELINE_VERSION') or _pipeline_version()
+
+
+def upload_digest(file):
+    """
+    Empreinte SHA-256 du contenu d'un fichier uploadé (le flux est remis au début)
+    """
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.stream.read(2**20), b''):
+        digest.update(block)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
+
+def result_cache_key(file, pipeline, suffix, backend, mode, delta=False):
+    """
+    Clé d'une archive : contenu de l'upload, pipeline, version du code, moteur de calcul, mode de
+    traitement, mode delta et suffixe des noms de fichiers (le suffixe Medor contient la date du jour)
+    """
+    return f'{pipeline}:{PIPELINE_VERSION}:{backend}:{mode}:delta={int(bool(delta))}:{upload_digest(file)}:{suffix}'
+
+
+def get_cached_result(key):
+    """
+    Retourne l'archive ZIP en cache pour cette clé, ou None
+    """
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"[cache] lecture impossible : {e}")
+        return None
+
+
+def _index_lock():
+    """
+    Verrou de l'index : verrou Redis partagé par tous les workers, sinon verrou du processus
+    """
+    client = getattr(cache.cache, '_write_client', None)
+    if client is None:
+        return _local_index_lock
+    return client.lock(f"{CACHE_CONFIG['CACHE_KEY_PREFIX']}{INDEX_KEY}:lock",
+                       timeout=INDEX_LOCK_TIMEOUT, blocking_timeout=INDEX_LOCK_TIMEOUT)
+
+
+def store_result(key, data):
+    """
+    Met l'archive en cache (si elle ne dépasse pas RESULT_CACHE_MAX_ENTRY_BYTES) et évince les
+    archives les plus anciennes tant que le total dépasse RESULT_CACHE_MAX_BYTES.
+    L'index est lu, modifié et réécrit sous verrou : deux workers ne peuvent pas s'écraser leurs mises à jour.
+    """
+    if len(data) > RESULT_CACHE_MAX_ENTRY_BYTES:
+        return
+    try:
+        with _index_lock():
+            now = time.time()
+            timeout = CACHE_CONFIG['CACHE_DEFAULT_TIMEOUT']
+            index = cache.get(INDEX_KEY) or {}
+            # Les entrées expirées ont déjà été supprimées par Redis
+            index = {entry: value for entry, value in index.items() if not timeout or value[1] + timeout > now}
+            index[key] = [len(data), now]
+            total = sum(size for size, _ in index.values())
+            for entry, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+                if total <= RESULT_CACHE_MAX_BYTES:
+                    break
+                cache.delete(entry)
+                del index[entry]
+                total -= size
+            if key in index:
+                cache.set(key, data)
+            cache.set(INDEX_KEY, index, timeout=0)
+    except Exception as e:
+        print(f"[cache] écriture impossible : {e}")
+
+
+def store_result_file(key, path):
+    """
+    Met en cache une archive déjà écrite sur disque
+    """
+    if os.path.getsize(path) <= RESULT_CACHE_MAX_ENTRY_BYTES:
+        with open(path, 'rb') as zip_file:
+            store_result(key, zip_file.read())
+
+
+def cache_stream(key, chunks):
+    """
+    Transmet les morceaux d'une archive envoyée en streaming et la met en cache une fois complète
+    (tant qu'elle ne dépasse pas RESULT_CACHE_MAX_ENTRY_BYTES)
+    """
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size <= RESULT_CACHE_MAX_ENTRY_BYTES:
+                parts.append(chunk)
+            else:
+                parts = None
+        yield chunk
+    if parts is not None:
+        store_result(key, b''.join(parts))
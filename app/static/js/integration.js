@@ -35,8 +35,13 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
-function pollTaskStatus(taskId) {
+function pollTaskStatus(taskId, messages) {
     const statusDiv = document.getElementById('status');
+    // Messages affichés en fin de tâche (par défaut ceux de la génération des templates Monoprix)
+    messages = Object.assign({
+        done: "Génération terminée. Téléchargement en cours...",
+        error: "Erreur lors de la génération des templates."
+    }, messages);
     fetch('/task_status/' + taskId)
         .then(response => response.json())
         .then(data => {
@@ -45,17 +50,17 @@ function pollTaskStatus(taskId) {
                 if (statusDiv) {
                     statusDiv.innerText = `Running... ${data.progress || 0}% - ${data.message || ""}`;
                 }
-                setTimeout(() => pollTaskStatus(taskId), 2000);
+                setTimeout(() => pollTaskStatus(taskId, messages), 2000);
             } else if (data.state === 'SUCCESS') {
                 if (statusDiv) {
-                    statusDiv.innerText = "Génération terminée. Téléchargement en cours...";
+                    statusDiv.innerText = messages.done;
                 }
                 window.location.href = '/download/' + taskId;
             } else {
                 // En cas d'erreur (FAILURE ou autre)
                 console.error("Task error:", data);
                 if (statusDiv) {
-                    statusDiv.innerText = "Erreur lors de la génération des templates.";
+                    statusDiv.innerText = messages.error;
                 }
             }
         })
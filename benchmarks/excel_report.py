@@ -0,0 +1,89 @@
+"""
+Compare l'écriture du rapport ALL_Errors_report avec save_dfs_to_excel (pandas.ExcelWriter
+en mémoire) et write_excel_report (xlsxwriter 'constant_memory' dans un fichier).
+
+Usage : python -m benchmarks.excel_report --rows 10000 100000
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from app.model.logic import save_dfs_to_excel
+from app.model.excel_writer import write_excel_report
+
+
+def build_report_frame(rows, width=20, seed=0):
+    """
+    DataFrame de rapport synthétique : colonnes texte, entières et décimales avec des valeurs manquantes
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for position in range(width):
+        if position % 3 == 0:
+            data[f'text_{position}'] = rng.choice(['BRASSERIE-OF', 'MALTERIE-REC', 'lot 42', None], rows)
+        elif position % 3 == 1:
+            data[f'int_{position}'] = rng.integers(0, 10**6, rows)
+        else:
+            values = rng.random(rows)
+            values[rng.random(rows) < 0.3] = np.nan
+            data[f'float_{position}'] = values
+    return pd.DataFrame(data)
+
+
+def write_with_pandas(dfs):
+    excel_buffer = BytesIO()
+    save_dfs_to_excel(*dfs, excel_buffer)
+    return len(excel_buffer.getvalue())
+
+
+def write_constant_memory(dfs):
+    path = write_excel_report(*dfs)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+WRITERS = [
+    ('save_dfs_to_excel', write_with_pandas),
+    ('write_excel_report', write_constant_memory),
+]
+
+
+def measure(writer, dfs):
+    """
+    Durée (sans tracemalloc) puis pic mémoire Python (avec tracemalloc) d'une écriture
+    """
+    started = time.perf_counter()
+    size = writer(dfs)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    writer(dfs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak, 'file_bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--width', type=int, default=20)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        df = build_report_frame(rows, args.width)
+        # Trois onglets de tailles différentes, comme les trois familles d'erreurs
+        dfs = [df.iloc[:rows // 4], df.iloc[:rows // 4], df]
+        for name, writer in WRITERS:
+            result = measure(writer, dfs)
+            print(f"{rows:>9} lignes  {name:<20} {result['seconds']:8.2f} s  "
+                  f"pic {result['peak_bytes'] / 2**20:8.1f} Mo  fichier {result['file_bytes'] / 2**20:6.1f} Mo")
+
+
+if __name__ == '__main__':
+    main()
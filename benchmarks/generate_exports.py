@@ -0,0 +1,171 @@
+"""
+Génère des exports Medor et Carlsberg synthétiques (CSV ';') pour les benchmarks.
+
+Usage : python -m benchmarks.generate_exports medor 100000 medor.csv --extra-columns 20
+        python -m benchmarks.generate_exports carlsberg 100000 carlsberg.csv --mix perfect=0.1,logical=0.1,missing=0.8
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+# Répartition par défaut des familles d'erreur
+DEFAULT_ERROR_MIX = {'perfect': 0.15, 'logical': 0.15, 'missing': 0.65, 'other': 0.05}
+
+# Types de trace, relations manquantes 'X->Y (champs)' et champs cités dans les messages, par export
+MEDOR_TRACE_TYPES = ['PRODUCTION', 'MATERIAL-RECEPTION', 'PAIRING', 'SHIPPING']
+MEDOR_RELATIONSHIPS = ['trace->MATERIAL-RECEPTION', 'trace->PRODUCTION', 'PRODUCTION->trace',
+                       'PAIRING->trace', 'MATERIAL-RECEPTION->trace', 'trace->SHIPPING']
+MEDOR_FIELDS = ['lotNumber', 'supplierCode', 'articleNumber', 'C.batchNumber', 'orderCode']
+
+CARLSBERG_TRACE_TYPES = ['BRASSERIE-COND', 'BRASSERIE-OF', 'BRASSERIE-REC',
+                         'MALTERIE-EXP', 'MALTERIE-OF', 'MALTERIE-REC']
+CARLSBERG_RELATIONSHIPS = ['trace->BRASSERIE-REC', 'trace->BRASSERIE-OF', 'BRASSERIE-COND->trace',
+                           'BRASSERIE-OF->trace', 'trace->MALTERIE-EXP', 'trace->MALTERIE-OF',
+                           'MALTERIE-EXP->trace', 'MALTERIE-OF->trace', 'BRASSERIE-REC->trace']
+CARLSBERG_FIELDS = ['NumeroLotProduction', 'NumeroLotProductionSource', 'C.NumeroLotSource',
+                    'NumeroLotReception', 'BonLivraison', 'NumeroBL', 'C.PredecesseurCelluleOrigine',
+                    'TypeFlux', 'NumeroFlux', 'CelluleDestination']
+
+MANUFACTURERS = ['Usine Nord', 'Usine Sud', 'Atelier Est', 'Atelier Ouest']
+
+
+def parse_error_mix(text):
+    """
+    Convertit 'perfect=0.2,logical=0.2,missing=0.6' en dictionnaire de proportions
+    """
+    mix = {}
+    for item in text.split(','):
+        family, value = item.split('=')
+        if family not in DEFAULT_ERROR_MIX:
+            raise ValueError(f"Famille d'erreur inconnue : {family}")
+        mix[family] = float(value)
+    return mix
+
+
+def _choice(rng, values, rows):
+    return pd.Series(np.asarray(values, dtype=object)[rng.integers(0, len(values), rows)])
+
+
+def _missing_relationship_messages(rng, rows, relationships, fields, max_parts=3):
+    """
+    Messages 'Missing relationship: X->Y (champ: valeur), ...' avec 1 à max_parts relations par ligne
+    """
+    messages = pd.Series('Missing relationship: ', index=range(rows), dtype=object)
+    parts_count = rng.integers(1, max_parts + 1, rows)
+    for part in range(max_parts):
+        text = (_choice(rng, relationships, rows) + ' (' + _choice(rng, fields, rows) + ': '
+                + pd.Series(rng.integers(1, 10**6, rows)).astype(str))
+        # Certaines relations citent deux champs
+        second_field = rng.random(rows) < 0.3
+        text[second_field] = (text[second_field] + ', ' + _choice(rng, fields, rows)[second_field] + ': '
+                              + pd.Series(rng.integers(1, 10**4, rows)).astype(str)[second_field])
+        text = text + ')'
+        separator = '' if part == 0 else ', '
+        messages = messages.where(parts_count <= part, messages + separator + text)
+    return messages
+
+
+def _error_messages(rng, rows, error_mix, relationships, fields):
+    """
+    Messages _ErrorMessage répartis selon error_mix (doublons parfaits, logiques, missing relationship, autres)
+    """
+    mix = {**{family: 0.0 for family in DEFAULT_ERROR_MIX}, **error_mix}
+    families = list(mix)
+    weights = np.array([mix[family] for family in families], dtype=float)
+    drawn = np.asarray(families, dtype=object)[rng.choice(len(families), rows, p=weights / weights.sum())]
+
+    references = 'TR_' + pd.Series(rng.integers(1, max(rows // 10, 2), rows)).astype(str)
+    messages = pd.Series('Invalid value for field ', index=range(rows), dtype=object) + _choice(rng, fields, rows)
+    messages[drawn == 'perfect'] = ('Duplicate with ' + references)[drawn == 'perfect']
+    messages[drawn == 'logical'] = ('Duplicate value of field ' + _choice(rng, fields, rows) + ' in ' + references)[drawn == 'logical']
+    missing = drawn == 'missing'
+    messages[missing] = _missing_relationship_messages(rng, rows, relationships, fields)[missing]
+    return messages
+
+
+def _created_at(rng, rows):
+    """
+    Dates de création ISO 8601 ('2024-03-05T10:00:00.000Z') sur l'année 2024
+    """
+    seconds = rng.integers(0, 366 * 24 * 3600, rows)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(seconds, unit='s')
+    return pd.Series(dates.strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+
+
+def _extra_columns(rng, rows, count):
+    """
+    Colonnes supplémentaires (texte, entiers, décimaux) partiellement remplies pour élargir l'export
+    """
+    columns = {}
+    for position in range(count):
+        empty = rng.random(rows) < 0.4
+        if position % 3 == 0:
+            values = 'valeur ' + pd.Series(rng.integers(0, 1000, rows)).astype(str)
+        elif position % 3 == 1:
+            values = pd.Series(rng.integers(0, 10**6, rows)).astype(float)
+        else:
+            values = pd.Series(rng.random(rows) * 100).round(3)
+        columns[f'field_{position}'] = values.mask(empty)
+    return columns
+
+
+def generate_export(kind, rows, extra_columns=10, error_mix=None, seed=0):
+    """
+    Export synthétique 'medor' ou 'carlsberg' de `rows` lignes, avec les colonnes brutes de l'export,
+    `extra_columns` colonnes supplémentaires et une répartition des erreurs `error_mix`
+    """
+    rng = np.random.default_rng(seed)
+    error_mix = error_mix or DEFAULT_ERROR_MIX
+    if kind == 'medor':
+        trace_types, relationships, fields = MEDOR_TRACE_TYPES, MEDOR_RELATIONSHIPS, MEDOR_FIELDS
+    elif kind == 'carlsberg':
+        trace_types, relationships, fields = CARLSBERG_TRACE_TYPES, CARLSBERG_RELATIONSHIPS, CARLSBERG_FIELDS
+    else:
+        raise ValueError(f"Type d'export inconnu : {kind}")
+
+    # Environ trois erreurs par trace pour que les occurrences répétées existent
+    trace_ids = rng.integers(0, max(rows // 3, 1), rows)
+    data = {
+        'TraceType': _choice(rng, trace_types, rows),
+        'TraceNumber': pd.Series(rng.integers(1, 10**5, rows)),
+        'traceId': 'trace-' + pd.Series(trace_ids).astype(str),
+        '_ErrorCode': pd.Series(rng.integers(100, 110, rows)),
+        '_ErrorMessage': _error_messages(rng, rows, error_mix, relationships, fields),
+        'createdAt': _created_at(rng, rows),
+        'hours_since_error': pd.Series(rng.integers(0, 5000, rows)),
+        'businessName': _choice(rng, ['Crystalchain'], rows),
+        'Manufacturer': _choice(rng, MANUFACTURERS, rows),
+    }
+    for field in fields:
+        data[field] = (field[:3].upper() + pd.Series(rng.integers(1, 10**6, rows)).astype(str)).mask(rng.random(rows) < 0.2)
+    data['C.quantity'] = pd.Series(rng.integers(1, 500, rows))
+    data.update(_extra_columns(rng, rows, extra_columns))
+    # Colonne toujours vide, supprimée par nettoyer_ligne_colonne
+    data['empty_column'] = np.nan
+    return pd.DataFrame(data)
+
+
+def write_export(path_or_buf, kind, rows, extra_columns=10, error_mix=None, seed=0):
+    """
+    Écrit un export synthétique au format des exports Medor/Carlsberg (CSV ';', sans index)
+    """
+    generate_export(kind, rows, extra_columns, error_mix, seed).to_csv(path_or_buf, sep=';', index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('kind', choices=['medor', 'carlsberg'])
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--extra-columns', type=int, default=10)
+    parser.add_argument('--mix', type=parse_error_mix, default=None,
+                        help="Répartition des erreurs, ex: perfect=0.15,logical=0.15,missing=0.65,other=0.05")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_export(args.output, args.kind, args.rows, args.extra_columns, args.mix, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Mesure la durée et le pic mémoire de chaque étape des pipelines Medor et Carlsberg, de l'écriture
+des rapports et de la route complète, sur des exports synthétiques. Les résultats sont écrits en JSON.
+
+Usage : python -m benchmarks.run --rows 10000 100000 1000000 --output bench.json
+        python -m benchmarks.run --rows 10000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from app.model.excel_writer import write_excel_report
+from app.model.ingest import read_export
+from app.model.logic import dataframe_to_csv, format_error_counts
+from app.model.pipeline import PipelineStats, run_medor_pipeline, run_carlsberg_pipeline
+from benchmarks.generate_exports import generate_export, parse_error_mix
+
+
+PIPELINES = {
+    'medor': run_medor_pipeline,
+    'carlsberg': run_carlsberg_pipeline,
+}
+
+
+def run_stages(pipeline, data, stats):
+    """
+    Exécute la logique d'une route étape par étape : lecture, pipeline, CSV, Excel et ZIP
+    """
+    df = stats.run('read_export', read_export, BytesIO(data), pipeline)
+    reports = PIPELINES[pipeline](df, stats)
+    del df
+    if pipeline == 'medor':
+        *reports, counts = reports
+        stats.run('format_error_counts', format_error_counts, counts)
+
+    csv_texts = [stats.run(f'dataframe_to_csv[{position}]', dataframe_to_csv, report)
+                 for position, report in enumerate(reports)]
+    excel_path = stats.run('write_excel_report', write_excel_report, *reports)
+
+    def write_zip():
+        zip_buffer = BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, False) as zip_file:
+            for position, text in enumerate(csv_texts):
+                zip_file.writestr(f'report_{position}.csv', text)
+            zip_file.write(excel_path, 'ALL_Errors_report.xlsx')
+        return zip_buffer
+
+    stats.run('zip', write_zip)
+    os.remove(excel_path)
+
+
+def measure_route(app, pipeline, data):
+    """
+    Durée et pic mémoire d'une requête POST complète sur la route /medor ou /carlsberg, y compris
+    la production de l'archive envoyée en streaming
+    """
+    client = app.test_client()
+
+    def post():
+        response = client.post(f'/{pipeline}', data={'file': (BytesIO(data), 'BENCH_EXPORT_FILE_1.csv')},
+                               content_type='multipart/form-data')
+        if response.mimetype != 'application/zip':
+            raise RuntimeError(f'La route /{pipeline} n\'a pas renvoyé de ZIP')
+        # Le ZIP n'est produit (CSV, Excel, compression) qu'au fil de la lecture de la réponse
+        try:
+            for _ in response.response:
+                pass
+        finally:
+            response.close()
+        return response
+
+    started = time.perf_counter()
+    post()
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    post()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark(pipeline, rows, extra_columns, error_mix, app=None, memory=True):
+    """
+    Résultats (une entrée par étape, plus la route complète) pour un pipeline et une taille d'export
+    """
+    data = generate_export(pipeline, rows, extra_columns, error_mix).to_csv(sep=';', index=False).encode()
+
+    timing = PipelineStats(enabled=False)
+    run_stages(pipeline, data, timing)
+    durations = {stage['stage']: stage['seconds'] for stage in timing.stages}
+    peaks = {}
+    if memory:
+        tracing = PipelineStats(enabled=True)
+        run_stages(pipeline, data, tracing)
+        peaks = {stage['stage']: stage['allocated_bytes'] for stage in tracing.stages}
+
+    results = [{'pipeline': pipeline, 'rows': rows, 'stage': name, 'seconds': seconds,
+                'peak_bytes': peaks.get(name)} for name, seconds in durations.items()]
+    results.append({'pipeline': pipeline, 'rows': rows, 'stage': 'total',
+                    'seconds': sum(durations.values()), 'peak_bytes': None})
+
+    if app is not None:
+        seconds, peak = measure_route(app, pipeline, data)
+        results.append({'pipeline': pipeline, 'rows': rows, 'stage': 'route', 'seconds': seconds,
+                        'peak_bytes': peak if memory else None})
+    return results
+
+
+def environment():
+    """
+    Contexte du run (versions, machine, commit) pour pouvoir comparer des résultats
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'date': datetime.now().isoformat(timespec='seconds'), 'commit': commit or None,
+            'python': platform.python_version(), 'pandas': pd.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def compare(results, reference_path):
+    """
+    Affiche le rapport de durée entre ce run et un fichier de résultats précédent
+    """
+    with open(reference_path, encoding='utf-8') as reference_file:
+        reference = {(r['pipeline'], r['rows'], r['stage']): r for r in json.load(reference_file)['results']}
+    for result in results:
+        previous = reference.get((result['pipeline'], result['rows'], result['stage']))
+        if previous is None or not previous['seconds']:
+            continue
+        ratio = result['seconds'] / previous['seconds']
+        print(f"{result['pipeline']:<10} {result['rows']:>9} {result['stage']:<50} "
+              f"{previous['seconds']:8.3f} s -> {result['seconds']:8.3f} s  (x{ratio:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--pipelines', nargs='+', choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument('--extra-columns', type=int, default=10)
+    parser.add_argument('--mix', type=parse_error_mix, default=None)
+    parser.add_argument('--no-memory', action='store_true', help="Ne pas mesurer la mémoire (plus rapide)")
+    parser.add_argument('--no-route', action='store_true', help="Ne pas mesurer la route Flask complète")
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', help="Fichier JSON d'un run précédent")
+    args = parser.parse_args()
+
+    app = None
+    if not args.no_route:
+        from app import create_app
+        from app.result_cache import CACHE_CONFIG
+        # Sans cache des résultats : chaque requête mesurée exécute le pipeline complet
+        app = create_app({**CACHE_CONFIG, 'CACHE_TYPE': 'NullCache'})
+
+    results = []
+    for rows in args.rows:
+        for pipeline in args.pipelines:
+            print(f"[bench] {pipeline} {rows} lignes")
+            results.extend(benchmark(pipeline, rows, args.extra_columns, args.mix, app, not args.no_memory))
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump({'environment': environment(), 'results': results}, output_file, indent=2)
+    print(f"[bench] résultats écrits dans {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
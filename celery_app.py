@@ -1,6 +1,8 @@
 # celery_app.py
 import os
+import time
 from celery import Celery
+from celery.signals import worker_init, task_prerun, task_postrun
 
 broker_url = os.getenv("CELERY_BROKER_URL", "pyamqp://guest@rabbitmq//")
 result_backend = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
@@ -13,5 +15,25 @@ celery_app.conf.update(
     accept_content=['json'],
 )
 
+# Métriques Prometheus du worker : exporteur local (CELERY_METRICS_PORT) et durée de chaque tâche.
+# Imports locaux : le package app importe le module tasks, qui importe ce module.
+_task_started = {}
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    from app.metrics import start_worker_exporter
+    start_worker_exporter()
+
+@task_prerun.connect
+def record_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        from app.metrics import observe_task
+        observe_task(task.name, state or 'UNKNOWN', time.perf_counter() - started)
+
 # Importer le module tasks pour enregistrer la tâche
 import tasks
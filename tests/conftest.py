@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+from benchmarks.generate_exports import generate_export
+
+
+EXPORT_ROWS = 1200
+
+
+def write_typed_export(path, kind, rows=EXPORT_ROWS):
+    """
+    Export synthétique dont certaines colonnes changent de type en fin de fichier (entiers puis valeur
+    manquante ou décimale, nombres puis texte) ou sont booléennes, avec ou sans valeurs manquantes
+    """
+    df = generate_export(kind, rows, extra_columns=3, seed=1)
+    rng = np.random.default_rng(2)
+    late = np.arange(rows) == rows - 100
+    df['code'] = pd.Series([f'{value:06d}' for value in rng.integers(0, 1000, rows)])
+    df['flag'] = rng.random(rows) < 0.5
+    df['flag_nan'] = pd.Series(rng.random(rows) < 0.5, dtype=object).mask(late)
+    df['int_nan'] = pd.Series(rng.integers(0, 100, rows), dtype=object).mask(late)
+    df['big_id'] = pd.Series(rng.integers(10**17, 9 * 10**18, rows))
+    df['mixed'] = pd.Series(rng.integers(0, 100, rows), dtype=object).where(~late, 'abc')
+    df['late_float'] = pd.Series(rng.integers(0, 100, rows), dtype=object).where(~late, 2.5)
+    df['small_float'] = pd.Series(rng.random(rows) * 1e-7)
+    df.to_csv(path, sep=';', index=False)
+    return str(path)
+
+
+@pytest.fixture
+def medor_export(tmp_path):
+    return write_typed_export(tmp_path / 'medor.csv', 'medor')
+
+
+@pytest.fixture
+def carlsberg_export(tmp_path):
+    return write_typed_export(tmp_path / 'carlsberg.csv', 'carlsberg')
+
+
+def sheet_values(data):
+    """
+    Valeur et type de chaque cellule de chaque onglet d'un classeur
+    """
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    return [[[(cell.value, cell.data_type) for cell in row] for row in sheet.iter_rows()]
+            for sheet in workbook.worksheets]
+
+
+def assert_same_archives(expected, actual):
+    """
+    Mêmes fichiers dans les deux archives ZIP : CSV et Parquet identiques, mêmes cellules Excel
+    """
+    assert sorted(expected.namelist()) == sorted(actual.namelist())
+    for name in expected.namelist():
+        if name.endswith('.xlsx'):
+            assert sheet_values(expected.read(name)) == sheet_values(actual.read(name)), name
+        elif name.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            assert pq.read_table(io.BytesIO(expected.read(name))).equals(
+                pq.read_table(io.BytesIO(actual.read(name)))), name
+        else:
+            assert expected.read(name) == actual.read(name), name
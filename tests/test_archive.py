@@ -0,0 +1,50 @@
+import io
+import threading
+import zipfile
+
+import pytest
+
+from app.model.archive import stream_zip, stream_zip_parallel, text_entry
+
+
+def make_entries(count, size=5000):
+    return [(f'report_{number}_é.csv', text_entry(f'{number};' * size)) for number in range(count)]
+
+
+def read_archive(chunks):
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.testzip() is None
+    return {info.filename: archive.read(info) for info in archive.infolist()}
+
+
+@pytest.mark.parametrize('workers', [2, 4])
+def test_parallel_zip_matches_sequential_zip(workers):
+    assert read_archive(stream_zip_parallel(make_entries(7), workers)) == read_archive(stream_zip(make_entries(7)))
+
+
+def test_parallel_zip_writes_zip64_records(monkeypatch):
+    # Limites abaissées : tailles, positions et nombre d'entrées passent par les extensions ZIP64
+    monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', 1000)
+    monkeypatch.setattr(zipfile, 'ZIP_FILECOUNT_LIMIT', 3)
+    chunks = list(stream_zip_parallel(make_entries(5), 2))
+    assert b'PK\x06\x06' in chunks[-1]
+    assert read_archive(chunks) == read_archive(stream_zip(make_entries(5)))
+
+
+def test_parallel_zip_limits_entries_in_flight():
+    started = []
+    lock = threading.Lock()
+
+    def writer_for(number):
+        def writer(entry):
+            with lock:
+                started.append(number)
+            entry.write(b'x' * 100)
+            yield
+        return writer
+
+    chunks = stream_zip_parallel([(f'{number}.txt', writer_for(number)) for number in range(10)], 2)
+    next(chunks)
+    # L'entrée 0 est en cours d'envoi : seules les deux suivantes peuvent avoir été lancées
+    assert max(started) <= 2
+    chunks.close()
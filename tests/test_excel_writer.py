@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from app.model.excel_writer import write_excel_report
+from conftest import sheet_values
+
+
+def test_excel_report_writes_infinite_values_like_to_excel(tmp_path):
+    df = pd.DataFrame({
+        'ratio': [1.5, np.inf, -np.inf, np.nan],
+        'mixed': pd.Series([np.inf, 'abc', -np.inf, None], dtype=object),
+        'count': [1, 2, 3, 4],
+    })
+    path = write_excel_report(df, df.head(0), df.tail(1), str(tmp_path / 'report.xlsx'))
+
+    expected_path = tmp_path / 'expected.xlsx'
+    with pd.ExcelWriter(expected_path, engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name='Logical_Duplicate sheet', index=False)
+        df.head(0).to_excel(writer, sheet_name='Perfect_Duplicate sheet', index=False)
+        df.tail(1).to_excel(writer, sheet_name='Missing_relationship sheet', index=False)
+
+    with open(path, 'rb') as report, open(expected_path, 'rb') as expected:
+        assert sheet_values(report.read()) == sheet_values(expected.read())
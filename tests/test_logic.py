@@ -0,0 +1,94 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from app.model.logic import (
+    iter_csv_chunks,
+    keep_first_occurrence_for_missing_relationship,
+    modify_error_type,
+    modify_error_type_carl,
+    sort_missing_relationships,
+)
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def read_missing_relationship_input():
+    """
+    Missing relationship Medor (ParentId répétés) avec un index non contigu et non trié,
+    comme après split_error_families
+    """
+    df = pd.read_csv(os.path.join(DATA_DIR, 'missing_relationship_input.csv'), sep=';')
+    df.index = [40, 12, 7, 3, 25, 18, 31]
+    return df
+
+
+def to_csv_text(df):
+    buffer = io.StringIO()
+    for _ in iter_csv_chunks(df, buffer):
+        pass
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('blank', ['string', 'mask'])
+def test_missing_relationship_matches_row_wise_output(blank):
+    """
+    Le CSV Missing_relationship est identique à celui des versions ligne par ligne (iterrows, apply)
+    de sort_missing_relationships, keep_first_occurrence_for_missing_relationship et modify_error_type
+    """
+    df = sort_missing_relationships(read_missing_relationship_input())
+    df = keep_first_occurrence_for_missing_relationship(df, 'ParentId', blank=blank)
+    df = modify_error_type(df)
+
+    with open(os.path.join(DATA_DIR, 'missing_relationship_expected.csv'), encoding='utf-8', newline='') as expected:
+        assert to_csv_text(df) == expected.read()
+
+
+def test_sort_missing_relationships_ignores_index():
+    df = read_missing_relationship_input()
+    by_position = sort_missing_relationships(df.reset_index(drop=True))
+    by_label = sort_missing_relationships(df)
+
+    assert by_label.index.tolist() == df.index.tolist()
+    pd.testing.assert_frame_equal(by_label.reset_index(drop=True), by_position)
+
+
+def test_modify_error_type_carl_translates_each_row_with_its_trace_type():
+    """
+    Une partition avec deux TraceType : chaque ligne est traduite avec les règles de son propre TraceType
+    """
+    df = pd.DataFrame({
+        'TraceType': ['BRASSERIE-OF', 'BRASSERIE-REC', 'BRASSERIE-OF', 'BRASSERIE-REC'],
+        'BRASSERIE-OF->trace': [
+            'BRASSERIE-OF->trace (NumeroLotProduction: L1)',
+            'BRASSERIE-OF->trace (NumeroLotReception: R1)',
+            '',
+            'BRASSERIE-OF->trace (NumeroLotReception: R2), BRASSERIE-OF->trace (NumeroLotProduction: L2)',
+        ],
+        'trace->MALTERIE-EXP': [
+            'trace->MALTERIE-EXP (BonLivraison: 5)',
+            'trace->MALTERIE-EXP (BonLivraison: 6)',
+            None,
+            '',
+        ],
+    }, index=[9, 2, 5, 0])
+
+    result = modify_error_type_carl(df)
+
+    assert result['BRASSERIE-OF->trace'].tolist() == [
+        'Absence BRASSERIE-OF aval dont un (C.NumeroLotSource: L1)',
+        'Absence BRASSERIE-OF aval dont un (C.NumeroLotSource: R1)',
+        '',
+        'Absence BRASSERIE-OF aval dont un (C.NumeroLotSource: R2),\n'
+        'Absence BRASSERIE-OF aval dont un (NumeroLotProduction: L2)',
+    ]
+    assert result['trace->MALTERIE-EXP'].tolist() == [
+        'Absence MALTERIE-EXP amont dont (BonLivraison: 5)',
+        'Absence MALTERIE-EXP amont dont (NumeroBL: 6)',
+        None,
+        '',
+    ]
+    assert result.index.tolist() == [9, 2, 5, 0]
@@ -0,0 +1,119 @@
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.comments import Comment
+from openpyxl.styles import Font, PatternFill
+
+from app.model import monoprix
+
+
+TEMPLATE_NAME = 'template_tlc.xlsx'
+HEADER = ['Reference Monoprix', 'NomProduit', 'Marque', 'TraceNumber', 'TraceType', 'Deactivated', 'Categorie']
+
+
+def write_template(path, title='Produits'):
+    """
+    Petit template produit : une feuille d'instructions, la feuille produit (en-tête, commentaires
+    en ligne 2, lignes de template mises en forme) et la feuille Format (champ 'enum')
+    """
+    wb = Workbook()
+    wb.active.title = 'Instructions'
+    wb.active['A1'] = 'Remplir la feuille produit'
+    ws = wb.create_sheet(title)
+    ws.append(HEADER)
+    ws.append(['Référence', 'Nom', 'Marque', None, None, None, 'Catégorie'])
+    ws['A2'].comment = Comment('Référence Monoprix du produit', 'Template')
+    ws['G2'].comment = Comment('Valeur de la liste', 'Template')
+    for row in range(3, monoprix.START_ROW + 3):
+        ws.cell(row=row, column=7).fill = PatternFill('solid', start_color='FFFF00')
+    format_ws = wb.create_sheet('Format')
+    format_ws.append(['Champ', 'Description', 'Type'])
+    format_ws.append(['Categorie', None, 'enum', None, None, 'Textile', 'Chaussure'])
+    wb.save(path)
+
+
+@pytest.fixture
+def templates_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'templates'
+    directory.mkdir()
+    write_template(directory / TEMPLATE_NAME)
+    monkeypatch.setattr(monoprix, 'TEMPLATES_DIR', str(directory))
+    monkeypatch.setattr(monoprix, 'TYPE_PRODUIT_TO_TEMPLATE', {'TLC': TEMPLATE_NAME})
+    monkeypatch.setattr(monoprix, '_templates', {})
+    return directory
+
+
+@pytest.fixture(params=[True, False], ids=['write_only', 'public_api'])
+def write_only_copy(request, monkeypatch):
+    monkeypatch.setattr(monoprix, 'WRITE_ONLY_COPY', request.param)
+    return request.param
+
+
+def supplier_rows():
+    return pd.DataFrame({
+        'ref_produits': ['R1', 'R2', 'R1', 'R3'],
+        'nom_du_produit': ['Pull', 'Veste', 'Pull bis', 'Jouet'],
+        'node_name': ['Marque A', 'Marque B', 'Marque A', 'Marque C'],
+        'Type_de_produit': ['TLC', 'TLC', 'TLC', 'Jouet'],
+    })
+
+
+def test_fill_supplier_templates(templates_dir, write_only_copy, tmp_path):
+    paths = monoprix.fill_supplier_templates('Fournisseur/A', supplier_rows(), shared_dir=str(tmp_path / 'out'))
+
+    assert paths == [str(tmp_path / 'out' / 'Fournisseur-A' / 'Fournisseur-A_TLC_CrystalChainMonoprix.xlsx')]
+    wb = load_workbook(paths[0])
+    assert wb.sheetnames == ['Instructions', 'Produits', 'Format']
+    assert wb['Instructions']['A1'].value == 'Remplir la feuille produit'
+    ws = wb['Produits']
+
+    # En-tête : police blanche, colonne Type_de_produit ajoutée en noir
+    header = [cell.value for cell in ws[1]]
+    assert header == HEADER + ['Type_de_produit']
+    assert all(cell.font.color.rgb == '00FFFFFF' for cell in ws[1][:len(HEADER)])
+    assert ws[1][len(HEADER)].font.color.rgb == '00000000'
+
+    # Commentaires de la ligne 2 recréés
+    assert ws['A2'].comment.text == 'Référence Monoprix du produit'
+    assert ws['A2'].comment.author == 'Auteur'
+    assert ws['G2'].comment.text == 'Valeur de la liste'
+    assert ws['A2'].font.color.rgb == '00FFFFFF'
+
+    # Liste déroulante du champ 'enum' de la feuille Format
+    validations = [(dv.type, dv.formula1, str(dv.sqref)) for dv in ws.data_validations.dataValidation]
+    assert validations == [('list', '"Textile,Chaussure"', f'G{monoprix.START_ROW}:G1048576')]
+
+    # Données dédoublonnées sur la référence, numérotées, et lignes de template conservées
+    rows = [[cell.value for cell in row[:len(HEADER)]]
+            for row in ws.iter_rows(min_row=monoprix.START_ROW, max_row=ws.max_row)]
+    assert rows[:2] == [
+        ['R1', 'Pull', 'Marque A', 1, 'PRODUIT-AGEC', 'false', None],
+        ['R2', 'Veste', 'Marque B', 2, 'PRODUIT-AGEC', 'false', None],
+    ]
+    assert ws.cell(row=monoprix.START_ROW, column=7).fill.start_color.rgb == '00FFFF00'
+    assert ws.max_row <= monoprix.START_ROW + 2
+
+
+def test_template_cache_reloads_changed_template(templates_dir):
+    path = str(templates_dir / TEMPLATE_NAME)
+    template = monoprix.get_template(path)
+    assert monoprix.get_template(path) is template
+
+    write_template(path, title='Articles')
+    os.utime(path, ns=(0, 0))
+    reloaded = monoprix.get_template(path)
+    assert reloaded is not template
+    assert reloaded.workbook.worksheets[1].title == 'Articles'
+
+
+def test_zip_templates(templates_dir, tmp_path):
+    shared_dir = str(tmp_path / 'out')
+    monoprix.fill_supplier_templates('A', supplier_rows(), shared_dir=shared_dir)
+    monoprix.fill_supplier_templates('B', supplier_rows(), shared_dir=shared_dir)
+
+    with zipfile.ZipFile(monoprix.zip_templates(shared_dir)) as archive:
+        assert sorted(archive.namelist()) == [os.path.join('A', 'A_TLC_CrystalChainMonoprix.xlsx'),
+                                              os.path.join('B', 'B_TLC_CrystalChainMonoprix.xlsx')]
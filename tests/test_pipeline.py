@@ -0,0 +1,45 @@
+import threading
+import tracemalloc
+
+from app.model.ingest import read_export
+from app.model.pipeline import PipelineStats, classify_medor, format_medor
+
+
+def test_concurrent_stages_share_tracemalloc():
+    second_started = threading.Event()
+    first_done = threading.Event()
+    tracing_during_second = []
+    first = PipelineStats(enabled=True)
+    second = PipelineStats(enabled=True)
+
+    def run_second():
+        with second.stage('second'):
+            second_started.set()
+            first_done.wait(5)
+            # L'étape qui a démarré la mesure est terminée : la mesure continue jusqu'à la dernière
+            tracing_during_second.append(tracemalloc.is_tracing())
+            data = bytearray(2**20)
+        del data
+
+    with first.stage('first'):
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        second_started.wait(5)
+    first_done.set()
+    thread.join()
+
+    assert tracing_during_second == [True]
+    assert not tracemalloc.is_tracing()
+    assert first.stages[0]['allocated_bytes'] is not None
+    # Pic non remis à zéro pour une étape démarrée pendant une autre
+    assert second.stages[0]['allocated_bytes'] is None
+    assert second.stages[0]['retained_bytes'] >= 2**20
+
+
+def test_format_medor_records_rows_of_each_stage(medor_export):
+    df, _ = classify_medor(read_export(medor_export, 'medor'))
+    stats = PipelineStats(enabled=False)
+    format_medor(df, stats, drop_empty_columns=False)
+    stages = {stage['stage']: stage for stage in stats.stages}
+    assert stages['nettoyer_ligne']['input_rows'] == len(df)
+    assert stages['nettoyer_ligne']['output_rows'] is not None
@@ -0,0 +1,37 @@
+import zipfile
+
+import pytest
+
+from app.model import polars_backend
+from app.model.archive import report_entries, text_entry, write_zip_file
+from app.model.ingest import read_export
+from app.model.logic import format_error_counts
+from app.model.pipeline import run_carlsberg_pipeline, run_medor_pipeline
+from conftest import assert_same_archives
+
+
+FORMATS = ['csv', 'xlsx', 'parquet']
+
+
+@pytest.mark.parametrize('pipeline', ['medor', 'carlsberg'])
+def test_polars_backend_matches_pandas(request, tmp_path, pipeline):
+    """
+    Mêmes fichiers avec les deux moteurs : colonnes numériques (avec ou sans valeurs manquantes),
+    booléennes et texte, occurrences répétées des missing relationship
+    """
+    path = request.getfixturevalue(f'{pipeline}_export')
+    if pipeline == 'medor':
+        *reports, counts = run_medor_pipeline(read_export(path, 'medor'))
+        df_kpi = format_error_counts(counts)
+        *polars_reports, polars_kpi = polars_backend.run_medor_pipeline_pl(path)
+    else:
+        reports = run_carlsberg_pipeline(read_export(path, 'carlsberg'))
+        df_kpi = polars_kpi = None
+        polars_reports = polars_backend.run_carlsberg_pipeline_pl(path)
+
+    pandas_zip = write_zip_file(str(tmp_path / 'pandas.zip'), report_entries('f', reports, df_kpi, FORMATS))
+    polars_zip = write_zip_file(str(tmp_path / 'polars.zip'), report_entries(
+        'f', polars_reports, polars_kpi, FORMATS,
+        csv_writer=lambda df: text_entry(polars_backend.to_csv_text(df)), to_pandas=polars_backend.to_pandas))
+
+    assert_same_archives(zipfile.ZipFile(pandas_zip), zipfile.ZipFile(polars_zip))
@@ -0,0 +1,23 @@
+import zipfile
+
+import pytest
+
+from app.model.archive import report_entries, write_zip_file
+from app.model.ingest import read_export
+from app.model.logic import format_error_counts
+from app.model.pipeline import run_medor_pipeline
+from app.model.streaming import process_medor_in_chunks
+from conftest import EXPORT_ROWS, assert_same_archives
+
+
+@pytest.mark.parametrize('chunksize', [250, EXPORT_ROWS])
+def test_stream_mode_matches_memory_mode(medor_export, tmp_path, chunksize):
+    *reports, counts = run_medor_pipeline(read_export(medor_export, 'medor'))
+    memory_zip = write_zip_file(str(tmp_path / 'memory.zip'),
+                                report_entries('f_2024-06-01', reports, format_error_counts(counts), ['csv', 'xlsx']))
+    stream_dir = tmp_path / 'stream'
+    stream_dir.mkdir()
+    with open(medor_export, 'rb') as source:
+        stream_zip = process_medor_in_chunks(source, str(stream_dir), 'f', '2024-06-01', chunksize=chunksize)
+
+    assert_same_archives(zipfile.ZipFile(memory_zip), zipfile.ZipFile(stream_zip))